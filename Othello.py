@@ -1,5 +1,20 @@
+import json
+import math
+import mmap
+import multiprocessing
 import os
 import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+import endgame
+from bitboard import legal_moves_mask
 
 # The outside edge is marked ?, empty squares are ., black is @, and white is o.
 # The black and white pieces represent the two players.
@@ -30,12 +45,22 @@ SQUARE_WEIGHTS = [
 MAX_VALUE = float('inf')
 MIN_VALUE = float('-inf')
 
-# The number of the move to be played
-move_number = 1
+# Iago solves the game exactly once this few empty squares are left
+ENDGAME_EMPTIES = 12
 
-# Array of values for edge positions
+# Array of values for edge positions. It is a list while being built, and a
+# read-only view of the memory-mapped file once loaded from edge_table.bin.
 edge_table = [0 for _ in range(3**10)]
 
+# The binary file edge_table was mapped from, if any
+edge_table_file = None
+
+# Header of the binary edge table file: magic, format version, array typecode
+# ('h' or 'i'), number of entries and CRC-32 of the little-endian entries
+EDGE_TABLE_MAGIC = b'OEDG'
+EDGE_TABLE_VERSION = 1
+EDGE_TABLE_HEADER = struct.Struct('<4sHcxII')
+
 # The four edges (with their X-squares)
 edge_and_x_lists = [[22, 11, 12, 13, 14, 15, 16, 17, 18, 27],
                     [72, 81, 82, 83, 84, 85, 86, 87, 88, 77],
@@ -60,12 +85,31 @@ static_edge_table = [[None, 0, -2000],  # X
                      [700, None, None], # corner
                      [None, 0, -2000]]  # X
 
+# All the valid squares on the board sorted from highest to lowest weight,
+# and the same squares as a set for membership tests
+SQUARES = tuple(sorted([i for i in range(11, 89) if 1 <= (i % 10) <= 8], key=lambda sq: SQUARE_WEIGHTS[sq], reverse=True))
+SQUARE_SET = frozenset(SQUARES)
+
 def squares():
     """
     List all the valid squares on the board
     sorted from highest to lowest weight.
     """
-    return sorted([i for i in range(11, 89) if 1 <= (i % 10) <= 8], key=lambda sq: SQUARE_WEIGHTS[sq], reverse=True)
+    return SQUARES
+
+def ray(square, direction):
+    """List the squares from `square` out to the edge in the given direction."""
+    result = []
+    sq = square + direction
+    while sq in SQUARE_SET:
+        result.append(sq)
+        sq += direction
+    return tuple(result)
+
+# For every valid square, the rays out to the edge in each direction.
+# BRACKET_RAYS only keeps the rays that are long enough to hold a bracket.
+RAYS = [{d: ray(sq, d) for d in DIRECTIONS} if sq in SQUARE_SET else None for sq in range(100)]
+BRACKET_RAYS = [tuple(r for r in rays.values() if len(r) > 1) if rays else None for rays in RAYS]
 
 def initial_board():
     """Create a new board with the initial black and white positions filled"""
@@ -77,8 +121,16 @@ def initial_board():
     board[54], board[55] = BLACK, WHITE
     return board
 
-# A vector of boards to be used and reused
-ply_boards = [initial_board() for _ in range(40)]
+# Random keys for Zobrist hashing: one for every piece on every square, and one
+# that is added when white is to move. A private generator with a fixed seed
+# keeps the keys the same in every process.
+_zobrist_random = random.Random(18)
+ZOBRIST = {BLACK: [_zobrist_random.getrandbits(64) for _ in range(100)],
+           WHITE: [_zobrist_random.getrandbits(64) for _ in range(100)]}
+ZOBRIST_WHITE_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# Bound types for transposition table entries
+EXACT, LOWER, UPPER = 0, 1, 2
 
 class IllegalMoveError(Exception):
     def __init__(self, player, move, board):
@@ -89,6 +141,9 @@ class IllegalMoveError(Exception):
     def __str__(self):
         return '{0} cannot move to square {1}'.format(PLAYERS[self.player], self.move)
 
+class SearchTimeout(Exception):
+    """Raised inside a search when its time or node budget runs out."""
+
 def print_board(board):
     """Get a string representation of the board."""
     rep = ''
@@ -98,69 +153,177 @@ def print_board(board):
         rep += '{0} {1}\n'.format(row, ' '.join(board[begin:end]))
     return rep
 
+def parse_position(text):
+    """Turn 64 squares given row by row into a board."""
+    board = [OUTER] * 100
+    for i, piece in enumerate(text):
+        board[INDEX_SQUARES[i]] = piece
+    return board
+
+def format_position(board):
+    """The 64 squares of board row by row, as parse_position reads them."""
+    return ''.join(board[sq] for sq in INDEX_SQUARES)
+
+def random_opening(n_moves, rng):
+    """A list of n_moves random legal moves from the initial position."""
+    board = initial_board()
+    player = BLACK
+    moves = []
+    while player is not None and len(moves) < n_moves:
+        move = rng.choice(legal_moves(player, board))
+        make_move(move, player, board)
+        moves.append(move)
+        player = next_player(board, player)
+    return moves
+
 def is_valid(move):
     """Is move a square on the board?"""
-    return isinstance(move, int) and move in squares()
+    return isinstance(move, int) and move in SQUARE_SET
 
 def opponent(player):
     """Get player's opponent piece."""
-    return BLACK if player is WHITE else WHITE
+    return BLACK if player == WHITE else WHITE
+
+# The square for each bit index of the bitboard representation (see
+# bitboard.py), and the bit index and bit of each square
+INDEX_SQUARES = [10*(i//8 + 1) + i%8 + 1 for i in range(64)]
+BIT_INDEX = {sq: i for i, sq in enumerate(INDEX_SQUARES)}
+SQUARE_BITS = {sq: 1 << i for i, sq in enumerate(INDEX_SQUARES)}
+
+def to_bitboards(player, board):
+    """Split board into a pair of bitboards (player's discs, opponent's discs)."""
+    opp = opponent(player)
+    mine, theirs = 0, 0
+    for sq, bit in SQUARE_BITS.items():
+        piece = board[sq]
+        if piece == player:
+            mine |= bit
+        elif piece == opp:
+            theirs |= bit
+    return mine, theirs
+
+def from_bitboards(black, white):
+    """Create a board from the bitboards of black's and white's discs."""
+    board = [OUTER] * 100
+    for sq, bit in SQUARE_BITS.items():
+        if black & bit:
+            board[sq] = BLACK
+        elif white & bit:
+            board[sq] = WHITE
+        else:
+            board[sq] = EMPTY
+    return board
 
 def find_bracket(square, player, board, direction):
     """
     Find a square that forms a bracket with `square` for `player` in the given
     `direction`. Returns None if no such squares exists.
     """
-    bracket = square + direction
-    if board[bracket] == player:
-        return None
     opp = opponent(player)
-    while board[bracket] == opp:
-        bracket += direction
-    return None if board[bracket] in (OUTER, EMPTY) else bracket
+    run = 0
+    for bracket in RAYS[square][direction]:
+        piece = board[bracket]
+        if piece != opp:
+            return bracket if piece == player and run else None
+        run += 1
+    return None
 
 def is_legal(move, player, board):
     """Is this a legal move for the player?"""
-    hasbracket = lambda direction: find_bracket(move, player, board, direction)
-    return board[move] == EMPTY and any(map(hasbracket, DIRECTIONS))
+    if board[move] != EMPTY:
+        return False
+    opp = opponent(player)
+    for line in BRACKET_RAYS[move]:
+        if board[line[0]] == opp:
+            for sq in line[1:]:
+                piece = board[sq]
+                if piece == player:
+                    return True
+                if piece != opp:
+                    break
+    return False
 
 def make_move(move, player, board):
-    """Update the board to reflect the move by the specified player."""
+    """
+    Update the board to reflect the move by the specified player.
+    Returns the list of flipped squares, which unmake_move needs to undo it.
+    """
     board[move] = player
+    flips = []
     for d in DIRECTIONS:
-        make_flips(move, player, board, d)
-    return board
+        make_flips(move, player, board, d, flips)
+    return flips
 
-def make_flips(move, player, board, direction):
-    """Flip pieces in the given direction as a result of the move by player."""
+def make_flips(move, player, board, direction, flips):
+    """
+    Flip pieces in the given direction as a result of the move by player,
+    adding the flipped squares to flips.
+    """
     bracket = find_bracket(move, player, board, direction)
     if not bracket:
         return
-    square = move + direction
-    while square != bracket:
+    for square in RAYS[move][direction]:
+        if square == bracket:
+            break
         board[square] = player
-        square += direction
+        flips.append(square)
+
+def unmake_move(move, player, board, flips):
+    """Undo the move by player that flipped the squares in flips."""
+    board[move] = EMPTY
+    opp = opponent(player)
+    for sq in flips:
+        board[sq] = opp
     
 def legal_moves(player, board):
     """Get a list of all legal moves for player."""
-    return [sq for sq in squares() if is_legal(sq, player, board)]
+    moves = legal_moves_mask(*to_bitboards(player, board))
+    return [sq for sq in squares() if moves & SQUARE_BITS[sq]]
+
+def legal_among(moves, player, board):
+    """The distinct moves in moves, skipping None, that are legal for player."""
+    result = []
+    for move in moves:
+        if move is not None and move not in result and is_legal(move, player, board):
+            result.append(move)
+    return result
+
+def iter_legal_moves(player, board, first=()):
+    """
+    Yield player's legal moves one at a time: those in first, then the rest
+    by square weight. Each square is only checked when the one before it has
+    been used, so a caller that stops early never looks at the rest.
+    """
+    tried = legal_among(first, player, board)
+    yield from tried
+    for sq in SQUARES:
+        if board[sq] == EMPTY and sq not in tried and is_legal(sq, player, board):
+            yield sq
 
 def any_legal_move(player, board):
     """Can player make any moves?"""
-    return any(is_legal(sq, player, board) for sq in squares())
+    # Checking squares until the first legal one is quicker than even
+    # converting the board to bitboards.
+    return next(iter_legal_moves(player, board), None) is not None
 
-def play(black_strategy, white_strategy):
-    """Play a game of Othello and return the final board and score."""
+def play(black_strategy, white_strategy, opening=()):
+    """
+    Play a game of Othello and return the final board and score.
+    The moves in opening, if any, are played before the strategies take over.
+    """
     board = initial_board()
     player = BLACK
     strategy = lambda who: black_strategy if who == BLACK else white_strategy
-    global move_number
-    move_number = 1
+    opening = list(opening)
     while player is not None:
-        move = get_move(strategy(player), player, board)
+        if opening:
+            move = opening.pop(0)
+            if not is_valid(move) or not is_legal(move, player, board):
+                raise IllegalMoveError(player, move, board)
+        else:
+            move = get_move(strategy(player), player, board)
         make_move(move, player, board)
         player = next_player(board, player)
-        move_number += 1
     return board, score(BLACK, board)
 
 def next_player(board, prev_player):
@@ -182,97 +345,938 @@ def get_move(strategy, player, board):
 
 def score(player, board):
     """Compute player's score (number of player's pieces minus opponent's)."""
-    mine, theirs = 0, 0
-    opp = opponent(player)
-    for sq in squares():
-        piece = board[sq]
-        if piece == player:
-            mine += 1
-        elif piece == opp:
-            theirs += 1
-    return mine - theirs
+    # Pieces are only ever placed on valid squares, so counting the whole
+    # board is the same as counting over squares().
+    return board.count(player) - board.count(opponent(player))
 
-def final_value(player, board):
-    """The game is over. Find the value of this board to player."""
-    diff = score(player, board)
+def final_value(player, board, state=None):
+    """
+    The game is over. Find the value of this board to player,
+    using the disc counts of a BoardState if there is one.
+    """
+    diff = state.score(player) if state is not None else score(player, board)
     if diff < 0:
         return MIN_VALUE
     elif diff > 0:
         return MAX_VALUE
     return diff
 
-def alphabeta(player, board, alpha, beta, depth, evaluate, killer):
+def move_number_of(board):
+    """
+    The number of the move to be played on board. Every move adds one piece
+    to the four of the initial position, so this is what play() would count.
+    """
+    return 64 - board.count(EMPTY) - 3
+
+class SearchContext:
+    """
+    The state of one search: the evaluation function, the number of the move
+    being searched for, and the optional transposition table, SearchStats and
+    SearchLimits. It is passed through alphabeta into the evaluation function
+    instead of being kept in module globals, so searches for different games
+    can run in one process at the same time. With pvs set, alphabeta does a
+    principal variation search. With a MoveOrdering, moves are ordered by its
+    history and killer tables instead of by square weight alone. A BoardState
+    of the board being searched is kept up to date by search_move and
+    unsearch_move, and used by Iago_eval and final_value. A ProbCut turns on
+    forward pruning.
+    """
+    def __init__(self, evaluate, move_number, table=None, stats=None, limits=None, pvs=False,
+                 ordering=None, state=None, probcut=None):
+        self.evaluate = evaluate
+        self.move_number = move_number
+        self.table = table
+        self.stats = stats
+        self.limits = limits
+        self.pvs = pvs
+        self.ordering = ordering
+        self.state = state
+        self.probcut = probcut
+
+# For every square, the (edge, weight) pairs it contributes to edge indices:
+# the position of each of edge_and_x_lists holding the square and its power
+# of 3 in the index.
+EDGE_WEIGHTS = [tuple((e, 3 ** (len(edge) - 1 - edge.index(sq)))
+                      for e, edge in enumerate(edge_and_x_lists) if sq in edge)
+                for sq in range(100)]
+
+class BoardState:
+    """
+    The four edge indices for each player and the disc counts of a board,
+    updated move by move instead of being recomputed at every leaf. With
+    check set, every update is compared with a computation from scratch.
+    """
+    def __init__(self, board, check=False):
+        self.edges = {who: [edge_index(who, board, edge) for edge in edge_and_x_lists] for who in (BLACK, WHITE)}
+        self.discs = {who: board.count(who) for who in (BLACK, WHITE)}
+        self.check = check
+
+    def make(self, move, player, board, flips):
+        """Update the state after make_move."""
+        mine, theirs = self.edges[player], self.edges[opponent(player)]
+        # A new disc counts 1 in player's indices and 2 in the opponent's;
+        # a flipped one goes from 2 to 1 and from 1 to 2.
+        for e, weight in EDGE_WEIGHTS[move]:
+            mine[e] += weight
+            theirs[e] += 2 * weight
+        for sq in flips:
+            for e, weight in EDGE_WEIGHTS[sq]:
+                mine[e] -= weight
+                theirs[e] += weight
+        self.discs[player] += 1 + len(flips)
+        self.discs[opponent(player)] -= len(flips)
+        if self.check:
+            self.verify(board)
+
+    def unmake(self, move, player, board, flips):
+        """Update the state after unmake_move."""
+        mine, theirs = self.edges[player], self.edges[opponent(player)]
+        for e, weight in EDGE_WEIGHTS[move]:
+            mine[e] -= weight
+            theirs[e] -= 2 * weight
+        for sq in flips:
+            for e, weight in EDGE_WEIGHTS[sq]:
+                mine[e] += weight
+                theirs[e] -= weight
+        self.discs[player] -= 1 + len(flips)
+        self.discs[opponent(player)] += len(flips)
+        if self.check:
+            self.verify(board)
+
+    def verify(self, board):
+        """Check the state against board."""
+        expected = BoardState(board)
+        assert self.edges == expected.edges and self.discs == expected.discs, print_board(board)
+
+    def edge_stability(self, player):
+        """edge_stability from the stored indices."""
+        indices = self.edges[player]
+        return edge_table[indices[0]] + edge_table[indices[1]] + edge_table[indices[2]] + edge_table[indices[3]]
+
+    def score(self, player):
+        """score from the stored counts."""
+        return self.discs[player] - self.discs[opponent(player)]
+
+def search_move(move, player, board, context):
+    """make_move, also updating the context's BoardState if it has one."""
+    flips = make_move(move, player, board)
+    if context.state is not None:
+        context.state.make(move, player, board, flips)
+    return flips
+
+def unsearch_move(move, player, board, flips, context):
+    """unmake_move, also updating the context's BoardState if it has one."""
+    unmake_move(move, player, board, flips)
+    if context.state is not None:
+        context.state.unmake(move, player, board, flips)
+
+def alphabeta(player, board, alpha, beta, depth, context, killer=None, key=None):
     """
     Alphabeta search, putting killer move first.
+    The SearchContext supplies the evaluation function, which is called as
+    evaluate(player, board, context), and the optional search state:
+    a transposition table is used for cutoffs and to pick the first move
+    (`key` is the Zobrist key of the position), SearchStats count the search,
+    and when SearchLimits run out SearchTimeout is raised, with the board
+    restored on the way out.
+    In a principal variation search (context.pvs) only the first move gets
+    the full window. The others are searched with a null window, just to
+    show that they are no better, and searched again if they are. This
+    needs an evaluation function with integer values.
+    With context.probcut (see probcut.py), a shallow search first predicts
+    the value at depth, and the node is cut if the prediction falls far
+    enough outside the window.
     """
+    table, stats, limits = context.table, context.stats, context.limits
+    if stats is not None:
+        stats.nodes += 1
+    if limits is not None:
+        limits.tick()
     # When depth is zero, don't examine possible moves. Just determine the value
     # of this board to the player.
     if depth == 0:
-        return evaluate(player, board), None
+        if stats is not None:
+            stats.leaf_evals += 1
+        return context.evaluate(player, board, context), None
+
+    if key is None:
+        key = zobrist_key(player, board)
+    if table is not None:
+        entry = table.probe(key)
+        if entry is not None:
+            _, entry_depth, bound, val, move, generation = entry
+            # A result from a search at least as deep can be used directly
+            # if it is exact or if its bound already falls outside the window.
+            # Results of earlier searches were evaluated for another move
+            # number, so they only suggest a move.
+            if (entry_depth >= depth and generation == table.generation and
+                    (bound == EXACT or (bound == LOWER and val >= beta) or (bound == UPPER and val <= alpha))):
+                if stats is not None:
+                    stats.table_cutoffs += 1
+                return val, move
+            # Otherwise the best move found earlier is tried first.
+            if move is not None:
+                killer = move
+
+    if context.probcut is not None:
+        cut = probcut(player, board, alpha, beta, depth, context, killer, key)
+        if cut is not None:
+            return cut, None
     
-    def value(board, alpha, beta, killer):
+    def value(board, alpha, beta, killer, key):
         # The value of a board is the opposite of its value to the opponent.
-        val, reply = alphabeta(opponent(player), board, -beta, -alpha, depth-1, evaluate, killer)
+        val, reply = alphabeta(opponent(player), board, -beta, -alpha, depth-1, context, killer, key)
         return -val, reply
     
     # We want to evaluate all the legal moves by considering their implications
-    # `depth` turns in advance. First, find all the legal moves, putting the
-    # killer move in front of the list.
-    moves = put_first(killer, legal_moves(player, board))
+    # `depth` turns in advance. The moves come from a generator, killer
+    # first, so those after a cutoff are never generated.
+    ordering = context.ordering
+    if ordering is None:
+        moves = iter_legal_moves(player, board, (killer,))
+    else:
+        moves = ordering.order(player, board, killer, depth, context)
 
-    # If player has no legal moves, then either:
-    if not moves:
-        # the game is over, so the best achievable score is victory or defeat
-        if not any_legal_move(opponent(player), board):
-            return final_value(player, board), None
-        # or we have to pass this turn, so just find the value of this board.
-        return value(board, alpha, beta, None)[0], None
-    
-    best_move = moves[0]
-    new_board = ply_boards[depth]
+    alpha0 = alpha
+    first_move = best_move = None
     killer2 = None
     killer2_val = MAX_VALUE
+    searched = 0
     for move in moves:
-        if alpha >= beta:
-            # If one of the legal moves leads to a better score than beta, then
-            # the opponent will avoid this branch, so we can quit looking.
-            break
-        val, reply = value(make_move(move, player, replace(new_board, board)), alpha, beta, killer2)
+        if not searched:
+            first_move = best_move = move
+        # The move is made on the board itself and undone after the search,
+        # so no copies of the board are needed.
+        flips = search_move(move, player, board, context)
+        try:
+            move_key = update_key(key, move, player, flips)
+            if context.pvs and searched and alpha > MIN_VALUE:
+                val, reply = value(board, alpha, alpha + 1, killer2, move_key)
+                if alpha < val < beta:
+                    if stats is not None:
+                        stats.pvs_researches += 1
+                    val, reply = value(board, val, beta, killer2, move_key)
+            else:
+                val, reply = value(board, alpha, beta, killer2, move_key)
+        finally:
+            unsearch_move(move, player, board, flips, context)
+        searched += 1
         if val > alpha:
             # If one of the moves leads to a better score than the current best
             # achievable score, then replace it with this one.
             alpha = val
             best_move = move
+            if alpha >= beta and ordering is not None:
+                ordering.cutoff(player, move, depth)
         if reply is not None and val < killer2_val:
             # If one of the moves leads to a reply that is worse than our worst
             # case scenario killer2, then replace it with this one.
             killer2 = reply
             killer2_val = val
+        if alpha >= beta:
+            # If one of the legal moves leads to a better score than beta, then
+            # the opponent will avoid this branch, so we can quit looking.
+            break
+
+    # If player has no legal moves, then either:
+    if not searched:
+        # the game is over, so the best achievable score is victory or defeat
+        if not any_legal_move(opponent(player), board):
+            return final_value(player, board, context.state), None
+        # or we have to pass this turn, so just find the value of this board.
+        return value(board, alpha, beta, None, key ^ ZOBRIST_WHITE_TO_MOVE)[0], None
+    if stats is not None:
+        stats.count_moves(first_move == killer, alpha >= beta, searched)
+    if table is not None:
+        if alpha <= alpha0:
+            bound = UPPER
+        elif alpha >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        table.store(key, depth, bound, alpha, best_move)
     return alpha, best_move
 
+def probcut(player, board, alpha, beta, depth, context, killer, key):
+    """
+    The ProbCut test for a node. The value at depth is predicted from a
+    shallow search as a * shallow + b, with an error of standard deviation
+    sigma. If a null-window shallow search shows that the prediction is
+    above beta (or below alpha) by threshold sigmas, return beta (or alpha).
+    Otherwise return None and let the node be searched in full.
+    """
+    params = context.probcut.lookup(depth, context.move_number)
+    if params is None:
+        return None
+    shallow, a, b, sigma = params
+    margin = context.probcut.threshold * sigma
+    stats = context.stats
+    if beta < MAX_VALUE:
+        bound = math.ceil((beta + margin - b) / a)
+        if stats is not None:
+            stats.probcut_tries += 1
+        if alphabeta(player, board, bound - 1, bound, shallow, context, killer, key)[0] >= bound:
+            if stats is not None:
+                stats.probcut_cuts += 1
+            return beta
+    if alpha > MIN_VALUE:
+        bound = math.floor((alpha - margin - b) / a)
+        if stats is not None:
+            stats.probcut_tries += 1
+        if alphabeta(player, board, bound, bound + 1, shallow, context, killer, key)[0] <= bound:
+            if stats is not None:
+                stats.probcut_cuts += 1
+            return alpha
+    return None
+
 def put_first(killer, moves):
     """
     Move the killer move to the front of moves,
     if the killer move is in fact a legal move.
     """
-    if killer in moves:
-        moves.insert(0, moves.pop(moves.index(killer)))
+    if killer is not None and moves and moves[0] != killer:
+        try:
+            moves.insert(0, moves.pop(moves.index(killer)))
+        except ValueError:
+            pass
     return moves
 
-def replace(seq1, seq2):
-    """Copies one sequence into another"""
-    seq1[:] = seq2
-    return seq1
+class MoveOrdering:
+    """
+    Move ordering state for one search. The history table scores every
+    square for each player, starting from SQUARE_WEIGHTS, and a move that
+    causes a cutoff adds depth squared to its score. The two most recent
+    killer moves (moves that caused a cutoff) are kept for every depth.
+    At nodes with at least mobility_depth plies left, moves are ordered by the
+    number of replies they leave the opponent instead. At nodes with at least
+    shallow_depth plies left, they are ordered by a search shallow_plies deep.
+    """
+    def __init__(self, mobility_depth=None, shallow_depth=None, shallow_plies=1):
+        self.history = {BLACK: SQUARE_WEIGHTS[:], WHITE: SQUARE_WEIGHTS[:]}
+        self.killers = {}
+        self.mobility_depth = mobility_depth
+        self.shallow_depth = shallow_depth
+        self.shallow_plies = shallow_plies
+
+    def order(self, player, board, first, depth, context):
+        """
+        Yield player's legal moves best first: first (the table or parent's
+        killer move), then the killers for this depth, then the rest by
+        score. The rest are only generated and sorted if the search gets
+        that far.
+        """
+        tried = legal_among((first,) + tuple(self.killers.get(depth, ())), player, board)
+        yield from tried
+        moves = [move for move in legal_moves(player, board) if move not in tried]
+        if len(moves) < 2:
+            yield from moves
+        elif self.shallow_depth is not None and depth >= self.shallow_depth:
+            yield from self.shallow_order(player, board, moves, context)
+        elif self.mobility_depth is not None and depth >= self.mobility_depth:
+            yield from self.mobility_order(player, board, moves)
+        else:
+            # The scores are kept up to date in place, so sorting costs only
+            # a list lookup per move.
+            moves.sort(key=self.history[player].__getitem__, reverse=True)
+            yield from moves
+
+    def mobility_order(self, player, board, moves):
+        """Sort moves by the opponent's number of replies, then by score."""
+        mine, theirs = to_bitboards(player, board)
+        history = self.history[player]
+        def key(move):
+            bit = SQUARE_BITS[move]
+            flipped = bitboard.flip_mask(bit, mine, theirs)
+            replies = bitboard.popcount(legal_moves_mask(theirs & ~flipped, mine | bit | flipped))
+            return replies, -history[move]
+        return sorted(moves, key=key)
+
+    def shallow_order(self, player, board, moves, context):
+        """Sort moves by the value of a shallow search after each of them."""
+        values = {}
+        for move in moves:
+            flips = search_move(move, player, board, context)
+            try:
+                values[move] = -alphabeta(opponent(player), board, MIN_VALUE, MAX_VALUE,
+                                          self.shallow_plies - 1, context)[0]
+            finally:
+                unsearch_move(move, player, board, flips, context)
+        return sorted(moves, key=values.__getitem__, reverse=True)
+
+    def cutoff(self, player, move, depth):
+        """Record that move caused a cutoff with depth plies left."""
+        self.history[player][move] += depth * depth
+        killers = self.killers.setdefault(depth, [None, None])
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def new_search(self):
+        """
+        Get ready to search another position: the killers, which belong to
+        depths of the old search, are dropped, and what the history scores
+        gained over SQUARE_WEIGHTS is halved.
+        """
+        self.killers.clear()
+        for history in self.history.values():
+            for sq in SQUARES:
+                history[sq] = SQUARE_WEIGHTS[sq] + (history[sq] - SQUARE_WEIGHTS[sq]) // 2
+
+def zobrist_key(player, board):
+    """Compute the Zobrist key of board with player to move."""
+    key = ZOBRIST_WHITE_TO_MOVE if player == WHITE else 0
+    for sq in squares():
+        piece = board[sq]
+        if piece in ZOBRIST:
+            key ^= ZOBRIST[piece][sq]
+    return key
+
+def update_key(key, move, player, flips):
+    """
+    Return the key of the position reached from the one with `key`
+    when player moves to `move`, flipping the squares in flips.
+    """
+    mine, theirs = ZOBRIST[player], ZOBRIST[opponent(player)]
+    key ^= mine[move] ^ ZOBRIST_WHITE_TO_MOVE
+    for sq in flips:
+        key ^= mine[sq] ^ theirs[sq]
+    return key
 
-def alphabeta_iterative(max_depth, evaluate):
-    """Return a strategy that does Alphabeta search with iterative deepening"""
+class TranspositionTable:
+    """
+    A fixed-size table of search results indexed by Zobrist key.
+    Each slot holds a (key, depth, bound, value, move, generation) tuple,
+    where generation numbers the search (see new_search) that stored it.
+    A new result replaces the one in its slot unless that one belongs to a
+    different position and was searched deeper in the same generation.
+    """
+    def __init__(self, size=2**16):
+        # The size is rounded down to a power of two so a mask picks the slot
+        self.mask = (1 << (size.bit_length() - 1)) - 1
+        self.entries = [None] * (self.mask + 1)
+        self.generation = 0
+
+    def probe(self, key):
+        """Return the entry for key, or None if there isn't one."""
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        """Record a search result for the position with key."""
+        index = key & self.mask
+        old = self.entries[index]
+        if old is None or old[0] == key or depth >= old[1] or old[5] != self.generation:
+            self.entries[index] = (key, depth, bound, value, move, self.generation)
+
+    def new_search(self):
+        """Start a new generation, aging the entries stored so far."""
+        self.generation += 1
+
+    def clear(self):
+        """Remove all entries."""
+        self.entries = [None] * (self.mask + 1)
+
+def principal_variation(player, board, key, table, max_length):
+    """
+    Follow the best moves stored in table from the position with key, for at
+    most max_length moves. A pass is listed as None.
+    """
+    pv = []
+    played = []
+    try:
+        while len(pv) < max_length:
+            moves = legal_moves(player, board)
+            if not moves:
+                if not any_legal_move(opponent(player), board):
+                    break
+                pv.append(None)
+                player, key = opponent(player), key ^ ZOBRIST_WHITE_TO_MOVE
+                continue
+            entry = table.probe(key)
+            if entry is None or entry[4] not in moves:
+                break
+            move = entry[4]
+            flips = make_move(move, player, board)
+            played.append((move, player, flips))
+            pv.append(move)
+            key = update_key(key, move, player, flips)
+            player = opponent(player)
+    finally:
+        for move, who, flips in reversed(played):
+            unmake_move(move, who, board, flips)
+    return pv
+
+def solve_endgame(player, board, exact=True, limits=None):
+    """
+    Search the position to the end of the game. Returns (value, move), where
+    value is player's final disc margin in exact mode, or -1, 0 or 1 for a
+    loss, draw or win otherwise, and move is None if player has to pass.
+    With SearchLimits, SearchTimeout is raised once they run out.
+    """
+    val, move = endgame.solve(*to_bitboards(player, board), exact=exact, limits=limits)
+    return val, (None if move is None else INDEX_SQUARES[move.bit_length() - 1])
+
+def endgame_solver(exact=True):
+    """
+    Return a strategy that plays the move with the best exact outcome.
+    Only practical with few empty squares left.
+    """
     def strategy(player, board):
-        depth = 1
+        return solve_endgame(player, board, exact)[1]
+    return strategy
+
+class SearchStats:
+    """
+    Counters for the search of one move. alphabeta updates them as it goes,
+    and the strategy adds one entry to `depths` per iteration.
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.table_cutoffs = 0
+        self.killer_tries = 0
+        self.killer_cutoffs = 0
+        self.pvs_researches = 0
+        self.aspiration_fails = 0
+        self.probcut_tries = 0
+        self.probcut_cuts = 0
+        self.depths = []
+
+    def count_moves(self, killer_first, cutoff, searched):
+        """Count the outcome of the move loop at an interior node."""
+        if killer_first:
+            self.killer_tries += 1
+        if cutoff:
+            self.beta_cutoffs += 1
+            if searched == 1:
+                self.first_move_cutoffs += 1
+                if killer_first:
+                    self.killer_cutoffs += 1
+
+    def record(self, **fields):
+        """Summarize the counters as a dict, together with the given fields."""
+        seconds = sum(d['seconds'] for d in self.depths)
+        record = dict(fields,
+                      nodes=self.nodes,
+                      leaf_evals=self.leaf_evals,
+                      beta_cutoffs=self.beta_cutoffs,
+                      first_move_cutoffs=self.first_move_cutoffs,
+                      table_cutoffs=self.table_cutoffs,
+                      killer_tries=self.killer_tries,
+                      killer_cutoffs=self.killer_cutoffs,
+                      killer_hit_rate=self.killer_cutoffs / self.killer_tries if self.killer_tries else None,
+                      first_move_cutoff_rate=(self.first_move_cutoffs / self.beta_cutoffs
+                                              if self.beta_cutoffs else None),
+                      pvs_researches=self.pvs_researches,
+                      aspiration_fails=self.aspiration_fails,
+                      probcut_tries=self.probcut_tries,
+                      probcut_cuts=self.probcut_cuts,
+                      interior_nodes=self.nodes - self.leaf_evals,
+                      seconds=seconds,
+                      nodes_per_second=self.nodes / seconds if seconds else None,
+                      depths=self.depths)
+        # The effective branching factor is the growth in nodes between the
+        # last two completed iterations.
+        completed = [d for d in self.depths if not d.get('aborted')]
+        if len(completed) > 1 and completed[-2]['nodes']:
+            record['branching_factor'] = completed[-1]['nodes'] / completed[-2]['nodes']
+        return record
+
+def stats_writer(file):
+    """Return a stats hook that writes each record to file as a JSON line."""
+    def hook(record):
+        file.write(json.dumps(record) + '\n')
+    return hook
+
+def aggregate_stats(records):
+    """Sum the counters of many stats records, e.g. over a batch of games."""
+    counters = ('nodes', 'leaf_evals', 'beta_cutoffs', 'first_move_cutoffs', 'table_cutoffs',
+                'killer_tries', 'killer_cutoffs', 'seconds')
+    total = {name: 0 for name in counters}
+    total['moves'] = 0
+    total['endgame_moves'] = 0
+    for record in records:
+        total['moves'] += 1
+        total['endgame_moves'] += bool(record.get('endgame'))
+        for name in counters:
+            total[name] += record.get(name, 0)
+    total['nodes_per_second'] = total['nodes'] / total['seconds'] if total['seconds'] else None
+    total['killer_hit_rate'] = total['killer_cutoffs'] / total['killer_tries'] if total['killer_tries'] else None
+    return total
+
+class SearchLimits:
+    """
+    A time and/or node budget for the search of one move. The time limit is
+    in milliseconds from the moment the limits are created. If cancelled is
+    given, it is called now and then and the search stops once it returns
+    true.
+    """
+    # The clock and cancelled are only checked every this many nodes
+    CHECK_EVERY = 256
+
+    def __init__(self, time_limit=None, node_limit=None, cancelled=None):
+        self.start = time.perf_counter()
+        self.deadline = None if time_limit is None else self.start + time_limit / 1000
+        self.node_limit = node_limit
+        self.cancelled = cancelled
+        self.nodes = 0
+
+    def tick(self):
+        """Count a node, raising SearchTimeout if the budget has run out."""
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if self.nodes % self.CHECK_EVERY == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.cancelled is not None and self.cancelled():
+                raise SearchTimeout()
+
+    def elapsed(self):
+        """Seconds since the limits were created."""
+        return time.perf_counter() - self.start
+
+    def can_afford(self, seconds, nodes):
+        """Is there likely enough budget left for an iteration of this size?"""
+        if self.deadline is not None and time.perf_counter() + seconds > self.deadline:
+            return False
+        if self.node_limit is not None and self.nodes + nodes > self.node_limit:
+            return False
+        return True
+
+def search_root(player, board, depth, context, killer, previous=None, aspiration=None):
+    """
+    Search the root to depth, with an aspiration window of the given width
+    around the value of a previous iteration if there is one.
+    """
+    if aspiration and previous is not None and MIN_VALUE < previous < MAX_VALUE:
+        alpha, beta = previous - aspiration // 2, previous + aspiration // 2
+        val, move = alphabeta(player, board, alpha, beta, depth, context, killer)
+        if alpha < val < beta:
+            return val, move
+        if context.stats is not None:
+            context.stats.aspiration_fails += 1
+        killer = move
+    return alphabeta(player, board, MIN_VALUE, MAX_VALUE, depth, context, killer)
+
+class SearchMemory:
+    """
+    What a strategy keeps between moves: its transposition table, its
+    MoveOrdering and the principal variation of its last search, which
+    predicts the position it will be asked about next. Its size is fixed by
+    the table size however long the game goes on. With pondering, the
+    predicted position is searched in a background thread until the
+    strategy is called again, and if the prediction was right the search
+    picks up the results.
+    """
+    def __init__(self, table, ordering):
+        self.table = table
+        self.ordering = ordering
+        self.pv = []
+        # The (player, board) expected next, with the board as a tuple,
+        # and the move the principal variation plays there
+        self.expected = None
+        self.expected_move = None
+        self.pondered = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, player, board):
+        """
+        Get ready to search player's move on board. Returns (move, hit): the
+        move the last principal variation predicts, if the game followed it,
+        and whether the position was pondered on.
+        """
+        self.stop()
+        position = (player, tuple(board))
+        hit = position == self.pondered
+        self.pondered = None
+        if not hit:
+            self.age()
+        return (self.expected_move if position == self.expected else None), hit
+
+    def age(self):
+        """Start a new generation of the table and age the move ordering."""
+        if self.table is not None:
+            self.table.new_search()
+        if self.ordering is not None:
+            self.ordering.new_search()
+
+    def finish(self, player, board, move, depth):
+        """
+        Remember the principal variation of a search to depth that chose
+        move, and the position it predicts after the opponent's reply.
+        """
+        self.expected = self.expected_move = None
+        key = zobrist_key(player, board)
+        board = board[:]
+        flips = make_move(move, player, board)
+        self.pv = [move]
+        if self.table is not None:
+            self.pv += principal_variation(opponent(player), board, update_key(key, move, player, flips),
+                                           self.table, depth - 1)
+        if len(self.pv) < 2:
+            return
+        if self.pv[1] is not None:
+            make_move(self.pv[1], opponent(player), board)
+        if any_legal_move(player, board):
+            self.expected = (player, tuple(board))
+            self.expected_move = self.pv[2] if len(self.pv) > 2 else None
+
+    def ponder(self, search):
+        """
+        Start a thread that calls search(player, board, cancelled) on the
+        expected position, where cancelled returns true once stop is called.
+        """
+        if self.expected is None:
+            return
+        self.age()
+        self.pondered = self.expected
+        self.stop_event.clear()
+        player, board = self.expected[0], list(self.expected[1])
+        self.thread = threading.Thread(target=search, args=(player, board, self.stop_event.is_set),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop pondering and wait for the thread to finish."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+def alphabeta_iterative(max_depth, evaluate, table_size=2**16, endgame_empties=0, stats_hook=None,
+                        time_limit=None, node_limit=None, cancelled=None, pvs=False, aspiration=None,
+                        ordering=None, incremental=False, probcut=None, persistent=False, ponder=False):
+    """
+    Return a strategy that does Alphabeta search with iterative deepening.
+    The iterations share a transposition table with table_size entries;
+    a table_size of 0 turns it off. Once there are endgame_empties empty
+    squares or fewer, the endgame solver picks the move instead.
+    If stats_hook is given, it is called with a stats record (a dict) for
+    every move searched. Moves found by the endgame solver get a record with
+    endgame set, counting the solver's nodes above its last few empties.
+    With a time_limit (milliseconds per move) or a node_limit, the search
+    deepens until max_depth or until the budget runs out, and plays the best
+    move of the last completed iteration. An iteration that isn't expected to
+    finish in the remaining budget isn't started. The endgame solver shares
+    the budget, and if it runs out first the move comes from what little
+    search is left, so endgame_empties should be kept small with tight
+    limits. The search can also be stopped early by cancelled, as in
+    SearchLimits.
+    With pvs, alphabeta does a principal variation search. With an
+    aspiration window, each iteration from the third on starts with the
+    window of that width around the value of the iteration two before, and
+    is searched again with the full window if the value falls outside.
+    If ordering is given, it is called for every move to get the
+    MoveOrdering for its search, e.g. MoveOrdering itself or
+    functools.partial(MoveOrdering, mobility_depth=4).
+    With incremental set, edge indices and disc counts are kept in a
+    BoardState during the search ('check' also verifies every update).
+    A ProbCut (see probcut.py) makes the search selective.
+    With persistent set, the table and the MoveOrdering are kept from move
+    to move in a SearchMemory, the strategy's `memory` attribute. With
+    ponder, which implies persistent, the strategy goes on searching the
+    position its principal variation predicts while the opponent thinks;
+    strategy.memory.stop() stops it.
+    """
+    def new_context(board, stats, limits, table, move_ordering):
+        state = BoardState(board, check=incremental == 'check') if incremental else None
+        return SearchContext(evaluate, move_number_of(board), table, stats, limits, pvs,
+                             move_ordering, state, probcut)
+
+    memory = None
+    if persistent or ponder:
+        memory = SearchMemory(TranspositionTable(table_size) if table_size else None,
+                              ordering() if ordering is not None else None)
+
+    def ponder_search(player, board, cancelled):
+        context = new_context(board, None, SearchLimits(cancelled=cancelled), memory.table, memory.ordering)
         killer = None
+        try:
+            for depth in range(1, max_depth + 1):
+                killer = search_root(player, board, depth, context, killer)[1]
+        except SearchTimeout:
+            pass
+
+    def strategy(player, board):
+        if memory is not None:
+            memory.stop()
+        limits = None
+        if time_limit is not None or node_limit is not None or cancelled is not None:
+            limits = SearchLimits(time_limit, node_limit, cancelled)
+        if board.count(EMPTY) <= endgame_empties:
+            # The solver's nodes are counted by ticking limits, so there
+            # have to be some when stats are wanted.
+            counter = limits if limits is not None or stats_hook is None else SearchLimits()
+            start = time.perf_counter()
+            try:
+                move = solve_endgame(player, board, limits=counter)[1]
+            except SearchTimeout:
+                # The budget is spent, so the search below gets no further
+                # than its first iterations.
+                pass
+            else:
+                if stats_hook is not None:
+                    stats = SearchStats()
+                    stats.nodes = counter.nodes
+                    stats.depths.append({'depth': board.count(EMPTY), 'nodes': counter.nodes,
+                                         'seconds': time.perf_counter() - start})
+                    stats_hook(stats.record(player=PLAYERS[player], move_number=move_number_of(board),
+                                            move=move, endgame=True))
+                return move
+        depth = 1
+        if memory is not None:
+            killer, hit = memory.start(player, board)
+            table, move_ordering = memory.table, memory.ordering
+        else:
+            killer, hit = None, False
+            table = TranspositionTable(table_size) if table_size else None
+            move_ordering = ordering() if ordering is not None else None
+        stats = SearchStats() if stats_hook is not None else None
+        context = new_context(board, stats, limits, table, move_ordering)
+        last_seconds, last_nodes, growth = 0, 0, 1
+        values = []
         while depth <= max_depth:
-            killer = alphabeta(player, board, MIN_VALUE, MAX_VALUE, depth, evaluate, killer)[1]
+            if limits is not None and values and not limits.can_afford(last_seconds * growth,
+                                                                       last_nodes * growth):
+                break
+            start = time.perf_counter()
+            limit_nodes = limits.nodes if limits is not None else 0
+            stats_nodes = stats.nodes if stats is not None else 0
+            try:
+                # Values alternate between odd and even depths, so the
+                # window is centered on the value from two iterations back.
+                val, move = search_root(player, board, depth, context, killer,
+                                        values[-2] if len(values) > 1 else None, aspiration)
+            except SearchTimeout:
+                # The board has been restored, and the unfinished iteration
+                # is thrown away.
+                if stats is not None:
+                    stats.depths.append({'depth': depth, 'nodes': stats.nodes - stats_nodes,
+                                         'seconds': time.perf_counter() - start, 'aborted': True})
+                break
+            killer = move
+            values.append(val)
+            seconds = time.perf_counter() - start
+            if limits is not None:
+                # The next iteration is expected to grow by as much as this one did.
+                iteration_nodes = limits.nodes - limit_nodes
+                growth = max(iteration_nodes / last_nodes, 1) if last_nodes else 1
+                last_seconds, last_nodes = seconds, iteration_nodes
+            if stats is not None:
+                stats.depths.append({'depth': depth, 'nodes': stats.nodes - stats_nodes, 'seconds': seconds})
             depth += 1
+        if not values:
+            # Not even the first iteration finished.
+            killer = legal_moves(player, board)[0]
+        if stats is not None:
+            fields = dict(player=PLAYERS[player], move_number=context.move_number, move=killer)
+            if memory is not None:
+                fields['ponder_hit'] = hit
+            stats_hook(stats.record(**fields))
+        if memory is not None:
+            memory.finish(player, board, killer, len(values))
+            if ponder:
+                memory.ponder(ponder_search)
         return killer
+    strategy.memory = memory
+    return strategy
+
+# In a worker process of a parallel search, the best value found so far at
+# the root. It is shared by all the workers of one pool.
+shared_alpha = None
+
+def init_search_worker(table, alpha):
+    """
+    Set up a worker process with the shared root bound and the edge table,
+    given either as the values or as the binary file to map.
+    """
+    global edge_table, shared_alpha
+    edge_table = load_edge_table(table) if isinstance(table, str) else table
+    shared_alpha = alpha
+
+def search_root_move(player, board, move, depth, evaluate, table_size):
+    """
+    Search one root move in a worker process. The window starts at the shared
+    alpha, and the shared alpha is raised if the move beats it.
+    Returns (value, alpha) where value is exact only if it is above alpha.
+    """
+    alpha = shared_alpha.value
+    table = TranspositionTable(table_size) if table_size else None
+    context = SearchContext(evaluate, move_number_of(board), table)
+    make_move(move, player, board)
+    val = -alphabeta(opponent(player), board, MIN_VALUE, -alpha, depth-1, context)[0]
+    if val > alpha:
+        with shared_alpha.get_lock():
+            if val > shared_alpha.value:
+                shared_alpha.value = val
+    return val, alpha
+
+def parallel_alphabeta(player, board, depth, context, killer, executor, alpha):
+    """
+    Alphabeta search with the root moves spread over the worker processes of
+    executor, whose workers share the bound `alpha` (see init_search_worker).
+    The first move is searched here with a full window, then the others are
+    searched in parallel. Returns (value, move), with the same move as
+    alphabeta, i.e. the first move in order with the best value.
+    """
+    moves = put_first(killer, legal_moves(player, board))
+    if len(moves) < 2 or depth < 2:
+        return alphabeta(player, board, MIN_VALUE, MAX_VALUE, depth, context, killer)
+
+    def value(move):
+        flips = make_move(move, player, board)
+        val = -alphabeta(opponent(player), board, MIN_VALUE, MAX_VALUE, depth-1, context)[0]
+        unmake_move(move, player, board, flips)
+        return val
+
+    first = value(moves[0])
+    alpha.value = first
+    table_size = context.table.mask + 1 if context.table is not None else 0
+    futures = [executor.submit(search_root_move, player, board, move, depth, context.evaluate, table_size)
+               for move in moves[1:]]
+    results = [(first, MIN_VALUE)] + [future.result() for future in futures]
+    best_val = max(val for val, _ in results)
+    for move, (val, bound) in zip(moves, results):
+        if val > bound and val == best_val:
+            return best_val, move
+        if val <= bound == best_val and value(move) == best_val:
+            # The move was searched after another one had reached best_val,
+            # so its result only shows that it is no better. It comes first,
+            # so search it again to find out whether it ties.
+            return best_val, move
+
+def alphabeta_parallel(max_depth, evaluate, workers=None, table_size=2**16, endgame_empties=0):
+    """
+    Like alphabeta_iterative, but the last iteration searches the root moves
+    in a pool of `workers` processes (one per CPU by default). The pool is
+    started on the first move and shared by all the moves of the strategy,
+    until strategy.close() shuts it down.
+    """
+    pool = []
+    alpha = multiprocessing.Value('d', MIN_VALUE)
+    def strategy(player, board):
+        if board.count(EMPTY) <= endgame_empties:
+            return solve_endgame(player, board)[1]
+        if not pool:
+            pool.append(ProcessPoolExecutor(workers, initializer=init_search_worker,
+                                            initargs=(edge_table_file or list(edge_table), alpha)))
+        killer = None
+        table = TranspositionTable(table_size) if table_size else None
+        context = SearchContext(evaluate, move_number_of(board), table)
+        for depth in range(1, max_depth):
+            killer = alphabeta(player, board, MIN_VALUE, MAX_VALUE, depth, context, killer)[1]
+        return parallel_alphabeta(player, board, max_depth, context, killer, pool[0], alpha)[1]
+    def close():
+        # The next move, if any, starts a new pool.
+        if pool:
+            pool.pop().shutdown()
+    strategy.close = close
     return strategy
 
 def adj(square):
@@ -286,6 +1290,13 @@ def mobility(player, board):
     adjacent to an opponent that are not legal moves.
     Returns current and potential mobility for player.
     """
+    return bitboard.mobility(*to_bitboards(player, board))
+
+def slow_mobility(player, board):
+    """
+    The square-by-square version of mobility. It is kept as the reference
+    that check_Iago_eval compares the bitboard version against.
+    """
     opp = opponent(player)
     current, potential = 0, 0
     for sq in squares():
@@ -318,6 +1329,8 @@ def edge_stability(player, board):
 
 def init_edge_table():
     """Initialize `edge_table`, starting from the empty board."""
+    global edge_table
+    edge_table = [0 for _ in range(3**10)]
     # Initialize the static values
     for n_pieces in range(11):
         def fn1(board, index):
@@ -362,11 +1375,10 @@ def possible_edge_moves_value(player, board, index):
 
 def possible_edge_move(player, board, sq):
     """Return a (prob, val) pair for a possible edge move."""
-    num_player = 1 if player == BLACK else 2
-    new_board = replace(ply_boards[num_player], board)
-    make_move(sq, player, new_board)
+    flips = make_move(sq, player, board)
+    val = -edge_table[edge_index(opponent(player), board, top_edge)]
+    unmake_move(sq, player, board, flips)
     prob = edge_move_probability(player, board, sq)
-    val = -edge_table[edge_index(opponent(player), new_board, top_edge)]
     return (prob, val)
 
 def combine_edge_moves(possibilities, player):
@@ -488,24 +1500,85 @@ def load_data(filename):
         dataset = [int(x) for x in next(f).split()]
     return dataset
 
-def create_edge_table():
+def save_edge_table(filename, data):
+    """Save edge table values in the binary format read by load_edge_table."""
+    typecode = 'h' if all(-2**15 <= x < 2**15 for x in data) else 'i'
+    values = array(typecode, data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    payload = values.tobytes()
+    header = EDGE_TABLE_HEADER.pack(EDGE_TABLE_MAGIC, EDGE_TABLE_VERSION, typecode.encode(),
+                                    len(values), zlib.crc32(payload))
+    with open(filename, 'wb') as f:
+        f.write(header + payload)
+
+def load_edge_table(filename):
     """
-    Create edge_table.txt if it doesn't exist.
-    Otherwise load data from edge_table.txt.
+    Map a binary edge table file into memory and return a read-only view of
+    its values, which can be indexed like a list. The pages are shared by all
+    processes that map the same file.
     """
-    if not os.path.exists('edge_table.txt'):
-        print('Creating \'edge_table.txt\'...')
-        init_edge_table()
-        save_data('edge_table.txt', edge_table)
-        print('\'edge_table.txt\' created')
-    else:
-        edge_table[:] = load_data('edge_table.txt')
-        print('\'edge_table.txt\' loaded')
+    with open(filename, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, typecode, count, checksum = EDGE_TABLE_HEADER.unpack_from(mapped)
+    if magic != EDGE_TABLE_MAGIC or version != EDGE_TABLE_VERSION:
+        raise ValueError('{0} is not a version {1} edge table'.format(filename, EDGE_TABLE_VERSION))
+    payload = memoryview(mapped)[EDGE_TABLE_HEADER.size:]
+    if zlib.crc32(payload) != checksum:
+        raise ValueError('{0} is corrupt'.format(filename))
+    typecode = typecode.decode()
+    if sys.byteorder != 'little':
+        values = array(typecode, payload)
+        values.byteswap()
+        return values
+    return payload.cast(typecode)[:count]
+
+def convert_edge_table(text_file='edge_table.txt', binary_file='edge_table.bin'):
+    """Convert an edge table saved by save_data to the binary format."""
+    save_edge_table(binary_file, load_data(text_file))
 
-def Iago_eval(player, board):
+def create_edge_table():
+    """
+    Load the edge table from edge_table.bin, converting edge_table.txt to it
+    first if there is no binary file yet. If neither file exists, build the
+    table with edge_builder and save it in both formats.
+    """
+    global edge_table, edge_table_file
+    if not os.path.exists('edge_table.bin'):
+        if not os.path.exists('edge_table.txt'):
+            # edge_builder imports this module, so it is imported here
+            from edge_builder import build_edge_table
+            print('Creating \'edge_table.txt\'...')
+            save_data('edge_table.txt', build_edge_table())
+            print('\'edge_table.txt\' created')
+        convert_edge_table('edge_table.txt', 'edge_table.bin')
+    edge_table = load_edge_table('edge_table.bin')
+    edge_table_file = os.path.abspath('edge_table.bin')
+    print('\'edge_table.bin\' loaded')
+
+def Iago_eval(player, board, context=None):
     """
     Combine edge stability, current mobility and
     potential mobility to arrive at an evaluation.
+    The coefficients depend on the move number of the search context,
+    or of the board itself when there is no context. The edge indices come
+    from the context's BoardState when it has one.
+    """
+    number = context.move_number if context is not None else move_number_of(board)
+    if context is not None and context.state is not None:
+        edge = context.state.edge_stability(player)
+    else:
+        edge = edge_stability(player, board)
+    # Both sides' mobility comes from a single conversion to bitboards.
+    mine, theirs = to_bitboards(player, board)
+    return Iago_combine(number, edge,
+                        bitboard.mobility(mine, theirs),
+                        bitboard.mobility(theirs, mine))
+
+def Iago_combine(move_number, edge, player_mobility, opponent_mobility):
+    """
+    Combine the edge stability and the (current, potential) mobility
+    of both players into Iago's evaluation at the given move number.
     """
     # The three factors are multiplied by coefficients
     # that vary by move number
@@ -516,19 +1589,55 @@ def Iago_eval(player, board):
         c_cur = 75000 + 1000 * move_number
     c_pot = 20000
     
-    p_cur, p_pot = mobility(player, board)
-    o_cur, o_pot = mobility(opponent(player), board)
+    p_cur, p_pot = player_mobility
+    o_cur, o_pot = opponent_mobility
     
-    score1 = round(c_edg * edge_stability(player, board) / 32000)
+    score1 = round(c_edg * edge / 32000)
     score2 = round(c_cur * (p_cur - o_cur) / (p_cur + o_cur + 2))
     score3 = round(c_pot * (p_pot - o_pot) / (p_pot + o_pot + 2))
     
     score = score1 + score2 + score3
     return score
 
-def Iago(depth):
-    """Use an approximation of Iago's evaluation function."""
-    return alphabeta_iterative(depth, Iago_eval)
+def check_Iago_eval(games=10, seed=0):
+    """
+    Play random games and check that Iago_eval gives the same value as the
+    square-by-square computation in every position, for both players.
+    Returns the number of positions checked.
+    """
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(games):
+        board = initial_board()
+        player = BLACK
+        while player is not None:
+            for who in (BLACK, WHITE):
+                expected = Iago_combine(move_number_of(board), edge_stability(who, board),
+                                        slow_mobility(who, board),
+                                        slow_mobility(opponent(who), board))
+                assert Iago_eval(who, board) == expected, print_board(board)
+                checked += 1
+            make_move(rng.choice(legal_moves(player, board)), player, board)
+            player = next_player(board, player)
+    return checked
+
+def Iago(depth, eval_cache=None, **options):
+    """
+    Use an approximation of Iago's evaluation function, looked up in an
+    EvalCache (see eval_cache.py) if one is given.
+    Other options are passed on to alphabeta_iterative.
+    """
+    options.setdefault('endgame_empties', ENDGAME_EMPTIES)
+    options.setdefault('incremental', True)
+    evaluate = Iago_eval
+    if eval_cache is not None:
+        from eval_cache import cached_eval
+        evaluate = cached_eval(Iago_eval, eval_cache)
+    return alphabeta_iterative(depth, evaluate, **options)
+
+def random_strategy(player, board):
+    """A strategy that always chooses a random legal move."""
+    return random.choice(legal_moves(player, board))
 
 def user_input(player, board):
     """Get input move from user"""
@@ -604,9 +1713,9 @@ if __name__ == '__main__':
         player = int(player)
 
     if player == 1:
-        board, score = play(user_input, Iago(4))
+        board, score = play(user_input, Iago(4, ponder=True))
     else:
-        board, score = play(Iago(4), user_input)
+        board, score = play(Iago(4, ponder=True), user_input)
 
     total = len([sq for sq in squares() if sq != EMPTY])
     black = int((total + score) / 2)
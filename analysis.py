@@ -0,0 +1,130 @@
+"""
+Position analysis.
+
+analyze scores the legal moves of a position instead of just picking one.
+All root moves are searched in one iterative deepening search that shares a
+transposition table, so each iteration starts from the results of the last
+one and each move's search from what the other moves' searches left behind.
+Principal variations are read back from the table.
+
+In multi-PV mode only the best k moves get exact scores. The others are only
+searched far enough to show that they are no better than the k-th best, and
+come back with an upper bound on their score.
+"""
+
+from Othello import (MAX_VALUE, MIN_VALUE, Iago_eval, SearchContext,
+                     SearchLimits, SearchStats, SearchTimeout,
+                     TranspositionTable, alphabeta, legal_moves, make_move,
+                     move_number_of, next_player, opponent, parse_position,
+                     principal_variation, unmake_move, update_key,
+                     zobrist_key)
+
+def search_root_moves(player, board, depth, context, order, multi_pv):
+    """
+    Search each root move in order to depth. Returns a dict from move to
+    (score, exact), where exact is False for upper bounds.
+    """
+    key = zobrist_key(player, board)
+    results = {}
+    exact_scores = []
+    for move in order:
+        # In multi-PV mode a move only needs an exact score if it can beat
+        # the k-th best exact score so far.
+        alpha = MIN_VALUE
+        if multi_pv and len(exact_scores) >= multi_pv:
+            alpha = sorted(exact_scores, reverse=True)[multi_pv - 1]
+        flips = make_move(move, player, board)
+        try:
+            val = -alphabeta(opponent(player), board, -MAX_VALUE, -alpha, depth - 1, context,
+                             key=update_key(key, move, player, flips))[0]
+        finally:
+            unmake_move(move, player, board, flips)
+        exact = val > alpha or alpha == MIN_VALUE
+        results[move] = (val, exact)
+        if exact:
+            exact_scores.append(val)
+    return results
+
+def analyze(player, board, depth=4, evaluate=Iago_eval, multi_pv=None, time_limit=None,
+            table=None, ordering=None):
+    """
+    Score the legal moves of player on board, searching to depth or until
+    time_limit milliseconds have passed, whichever is first. With multi_pv,
+    only the best multi_pv moves are scored exactly. A table passed in is
+    used and kept, so analyses of nearby positions can share results; the
+    entries of earlier analyses were scored for another move number, so
+    they only pick the moves to try first. ordering is a MoveOrdering
+    factory as in alphabeta_iterative.
+
+    Returns a dict with the last completed depth, the number of nodes
+    searched, and a list of lines, best first. Each line is a dict with the
+    move, its score, whether the score is exact or an upper bound, and its
+    principal variation (starting with the move itself). With multi_pv, the
+    best multi_pv lines come first with exact scores, followed by the rest
+    ordered by their upper bounds.
+    """
+    moves = legal_moves(player, board)
+    if table is None:
+        table = TranspositionTable()
+    else:
+        table.new_search()
+    limits = SearchLimits(time_limit) if time_limit is not None else None
+    stats = SearchStats()
+    context = SearchContext(evaluate, move_number_of(board), table, stats, limits,
+                            ordering=ordering() if ordering is not None else None)
+    results, completed = {}, 0
+    for d in range(1, depth + 1):
+        if not moves:
+            break
+        # The moves are searched in the order of the last iteration's scores.
+        order = sorted(moves, key=lambda move: results[move][0] if move in results else 0, reverse=True)
+        try:
+            results = search_root_moves(player, board, d, context, order, multi_pv)
+        except SearchTimeout:
+            break
+        completed = d
+
+    key = zobrist_key(player, board)
+    lines = []
+    for move, (score, exact) in results.items():
+        flips = make_move(move, player, board)
+        try:
+            pv = [move] + principal_variation(opponent(player), board, update_key(key, move, player, flips),
+                                              table, completed - 1)
+        finally:
+            unmake_move(move, player, board, flips)
+        lines.append({'move': move, 'score': score, 'exact': exact, 'pv': pv})
+    if multi_pv:
+        # Moves searched before there were multi_pv exact scores got exact
+        # scores too, but only the best multi_pv are reported as exact. The
+        # others' scores are upper bounds like the rest.
+        best = sorted((line for line in lines if line['exact']), key=lambda line: line['score'],
+                      reverse=True)[:multi_pv]
+        for line in lines:
+            line['exact'] = any(line is other for other in best)
+    lines.sort(key=lambda line: (line['exact'], line['score']), reverse=True)
+    return {'depth': completed, 'nodes': stats.nodes, 'lines': lines}
+
+def check_shared_table(depth=5, child_depth=3):
+    """
+    Analyze each benchmark position and then the position after its best
+    move, and check that the second analysis scores the moves the same with
+    the first one's table as with a fresh table. Returns the number of
+    positions checked.
+    """
+    from benchmark import BENCHMARK_POSITIONS
+    checked = 0
+    for text, player in BENCHMARK_POSITIONS:
+        board = parse_position(text)
+        table = TranspositionTable()
+        best = analyze(player, board, depth, table=table)['lines'][0]['move']
+        make_move(best, player, board)
+        player = next_player(board, player)
+        if player is None:
+            continue
+        shared = analyze(player, board, child_depth, table=table)
+        fresh = analyze(player, board, child_depth)
+        scores = lambda result: {line['move']: (line['score'], line['exact']) for line in result['lines']}
+        assert scores(shared) == scores(fresh), (text, shared['lines'], fresh['lines'])
+        checked += 1
+    return checked
@@ -0,0 +1,183 @@
+"""
+Batched evaluation of many positions at once.
+
+Iago_eval_batch takes an (N, 64) array with one row per position, the squares
+row by row, holding 0 for an empty square, 1 for a disc of the player to
+evaluate for and 2 for an opponent's disc (the digits of edge_index).
+Iago_eval_bitboards takes the same positions as two arrays of bitboards,
+numbered as in bitboard.py. Both return the N values Iago_eval would give.
+
+Mobility is computed with the bitboard shifts of bitboard.py applied to whole
+arrays, and the edge indices by weighting the digits on each edge. The final
+combination does the same integer and floating point operations as
+Iago_combine, and NumPy rounds halves to even like round, so the values are
+exactly equal. Without NumPy the positions are evaluated one by one.
+"""
+
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import Othello
+from Othello import (BIT_INDEX, BLACK, INDEX_SQUARES, WHITE, Iago_eval,
+                     SearchContext, edge_and_x_lists, from_bitboards,
+                     initial_board, legal_moves, make_move, next_player,
+                     opponent, to_bitboards)
+from bitboard import NOT_A_FILE, NOT_H_FILE, SHIFTS
+
+# The bit indices of the squares of each edge, in edge_index order
+EDGE_BITS = [[BIT_INDEX[sq] for sq in edge] for edge in edge_and_x_lists]
+
+def board_digits(player, board):
+    """The row of Iago_eval_batch's input for player on board."""
+    opp = opponent(player)
+    return [1 if board[sq] == player else 2 if board[sq] == opp else 0 for sq in INDEX_SQUARES]
+
+if np is not None:
+    MASKS = {mask: np.uint64(mask) for mask in (NOT_A_FILE, NOT_H_FILE)}
+    BIT_VALUES = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+    # The weight of each square of an edge in its base 3 index
+    EDGE_WEIGHTS = np.zeros((64, len(EDGE_BITS)), dtype=np.int64)
+    for e, bits in enumerate(EDGE_BITS):
+        for k, bit in enumerate(bits):
+            EDGE_WEIGHTS[bit, e] = 3 ** (len(bits) - 1 - k)
+
+    if hasattr(np, 'bitwise_count'):
+        def popcount(bits):
+            """Count the set bits of each element."""
+            return np.bitwise_count(bits).astype(np.int64)
+    else:
+        BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+        def popcount(bits):
+            """Count the set bits of each element."""
+            return BYTE_COUNTS[bits.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+def shift(bits, n, mask):
+    """bitboard.shift for an array of bitboards."""
+    if n > 0:
+        result = np.left_shift(bits, np.uint64(n))
+    else:
+        result = np.right_shift(bits, np.uint64(-n))
+    return result & MASKS[mask] if mask in MASKS else result
+
+def legal_moves_mask(mine, theirs):
+    """bitboard.legal_moves_mask for arrays of bitboards."""
+    empty = ~(mine | theirs)
+    moves = np.zeros_like(mine)
+    for n, mask in SHIFTS:
+        x = shift(mine, n, mask) & theirs
+        for _ in range(5):
+            x |= shift(x, n, mask) & theirs
+        moves |= shift(x, n, mask) & empty
+    return moves
+
+def neighbors_mask(bits):
+    """bitboard.neighbors_mask for an array of bitboards."""
+    result = np.zeros_like(bits)
+    for n, mask in SHIFTS:
+        result |= shift(bits, n, mask)
+    return result
+
+def mobility(mine, theirs):
+    """bitboard.mobility for arrays of bitboards, as two arrays of counts."""
+    empty = ~(mine | theirs)
+    current = legal_moves_mask(mine, theirs)
+    potential = neighbors_mask(theirs) & empty
+    return popcount(current), popcount(current | potential)
+
+def to_digits(mine, theirs):
+    """The (N, 64) digit array of arrays of bitboards."""
+    mine_bits = (mine[:, None] & BIT_VALUES) != 0
+    theirs_bits = (theirs[:, None] & BIT_VALUES) != 0
+    return mine_bits.astype(np.int64) + 2 * theirs_bits.astype(np.int64)
+
+def to_bitboard_arrays(positions):
+    """The (mine, theirs) bitboard arrays of an (N, 64) digit array."""
+    positions = np.asarray(positions)
+    mine = np.where(positions == 1, BIT_VALUES, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    theirs = np.where(positions == 2, BIT_VALUES, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    return mine, theirs
+
+def edge_stability(positions):
+    """Othello.edge_stability for an (N, 64) digit array."""
+    table = np.asarray(Othello.edge_table)
+    return table[np.asarray(positions, dtype=np.int64) @ EDGE_WEIGHTS].sum(axis=1).astype(np.int64)
+
+def Iago_combine(move_number, edge, p_cur, p_pot, o_cur, o_pot):
+    """Othello.Iago_combine for arrays."""
+    move_number = np.asarray(move_number, dtype=np.int64)
+    c_edg = 312000 + 6240 * move_number
+    c_cur = np.where(move_number < 25, 50000 + 2000 * move_number, 75000 + 1000 * move_number)
+    c_pot = 20000
+    score1 = np.rint(c_edg * edge / 32000)
+    score2 = np.rint(c_cur * (p_cur - o_cur) / (p_cur + o_cur + 2))
+    score3 = np.rint(c_pot * (p_pot - o_pot) / (p_pot + o_pot + 2))
+    return score1.astype(np.int64) + score2.astype(np.int64) + score3.astype(np.int64)
+
+def evaluate(positions, mine, theirs, move_numbers):
+    """Iago's evaluation from both forms of the positions."""
+    if move_numbers is None:
+        move_numbers = 64 - popcount(~(mine | theirs)) - 3
+    p_cur, p_pot = mobility(mine, theirs)
+    o_cur, o_pot = mobility(theirs, mine)
+    return Iago_combine(move_numbers, edge_stability(positions), p_cur, p_pot, o_cur, o_pot)
+
+def Iago_eval_batch(positions, move_numbers=None):
+    """
+    Evaluate each row of an (N, 64) digit array for the player whose discs
+    are 1s. The move numbers (an array, or one number for all positions)
+    default to those of the boards themselves, like Iago_eval without a
+    search context.
+    """
+    if np is None:
+        boards = [[Othello.OUTER] * 100 for _ in positions]
+        for board, row in zip(boards, positions):
+            for sq, digit in zip(INDEX_SQUARES, row):
+                board[sq] = (Othello.EMPTY, BLACK, WHITE)[digit]
+        return evaluate_one_by_one(boards, move_numbers)
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 64)
+    mine, theirs = to_bitboard_arrays(positions)
+    return evaluate(positions, mine, theirs, move_numbers)
+
+def Iago_eval_bitboards(mine, theirs, move_numbers=None):
+    """Iago_eval_batch for positions given as arrays of bitboards."""
+    if np is None:
+        return evaluate_one_by_one([from_bitboards(m, t) for m, t in zip(mine, theirs)], move_numbers)
+    mine = np.asarray(mine, dtype=np.uint64)
+    theirs = np.asarray(theirs, dtype=np.uint64)
+    return evaluate(to_digits(mine, theirs), mine, theirs, move_numbers)
+
+def evaluate_one_by_one(boards, move_numbers):
+    """The batch evaluation of boards for black without NumPy, as a list."""
+    if move_numbers is None:
+        return [Iago_eval(BLACK, board) for board in boards]
+    if isinstance(move_numbers, int):
+        move_numbers = [move_numbers] * len(boards)
+    return [Iago_eval(BLACK, board, SearchContext(Iago_eval, n)) for board, n in zip(boards, move_numbers)]
+
+def check_batch_eval(games=10, seed=0):
+    """
+    Play random games and check that both batch evaluations agree with
+    Iago_eval in every position, for both players.
+    Returns the number of positions checked.
+    """
+    rng = random.Random(seed)
+    rows, pairs, expected = [], [], []
+    for _ in range(games):
+        board = initial_board()
+        player = BLACK
+        while player is not None:
+            for who in (BLACK, WHITE):
+                rows.append(board_digits(who, board))
+                pairs.append(to_bitboards(who, board))
+                expected.append(Iago_eval(who, board))
+            make_move(rng.choice(legal_moves(player, board)), player, board)
+            player = next_player(board, player)
+    mine, theirs = zip(*pairs)
+    assert list(Iago_eval_batch(rows)) == expected
+    assert list(Iago_eval_bitboards(mine, theirs)) == expected
+    return len(expected)
@@ -0,0 +1,276 @@
+"""
+Batch self-play and benchmarks.
+
+Strategies are described by specs so that they can be built inside worker
+processes. A spec is either the name of a strategy function in Othello.py,
+like 'random_strategy', or a tuple of the name of a strategy factory and its
+arguments, like ('Iago', 3). String arguments that name something in
+Othello.py are replaced by it, so ('alphabeta_iterative', 4, 'Iago_eval')
+works too.
+
+Run as a script for a match between two strategies and a run over the fixed
+benchmark positions, e.g.
+
+    python benchmark.py Iago:3 Iago:2 --games 20
+
+or, with --modes, to compare the node counts of the search modes at one
+depth:
+
+    python benchmark.py --modes 5
+"""
+
+import argparse
+import functools
+import inspect
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Othello
+from Othello import (BLACK, WHITE, init_search_worker, parse_position, play,
+                     random_opening)
+
+# Positions from seeded random games, 51 to 22 empty squares, for node count
+# and timing comparisons. Each is the 64 squares row by row and the player
+# to move.
+BENCHMARK_POSITIONS = [
+    ('...................@.......@@o.....@oooo....@o......o@..........', WHITE),
+    ('.............o......o.@....o@@.....o@o.....oooo.......@.........', BLACK),
+    ('..@o......oo.....o.o@.....oo@.....@oo....o@o.o....@...o.........', WHITE),
+    ('..........ooo....@.ooo@...@ooooo...oo.@...@@@...................', BLACK),
+    ('......o...o.@@@..o.@@...oooooo...o@@o@...o@@@@.......@..........', WHITE),
+    ('....o......oo.....@o@@....@o@@..@@@o@......ooo...@@oo....o.o.o..', BLACK),
+    ('.....o@.ooo.o@@..o@o@o@oo@@@@@@...@@@@@....@@@@.................', WHITE),
+    ('..@.@...oooooo..@.@.oo....@o@ooo..oooooo.o@@@..@o@......@.......', BLACK),
+    ('.........@oo.@@...oo@@@..o@@@.@.ooo@@o@@.@ooo@..@@@.oo@.o.@..o..', WHITE),
+    ('.......@..o.o@@.oo.o@o...oo@ooo..@oo@oo..@ooo@oo.@@@@oo...o@..o.', BLACK),
+    ('o......o@oo..@o@.@@@@o@@o.@@@@@@.@o@o@o.@.oo@oo....oo@....@o.@o.', WHITE),
+    ('.@.@.ooo.@@@@oo@.@.@@@@ooo@ooo@o..o@oooo.oo.oo@ooo..o..o........', BLACK),
+]
+
+# Options of alphabeta_iterative for the search modes compared by compare_modes
+SEARCH_MODES = {'alphabeta': {},
+                'pvs': {'pvs': True},
+                'aspiration': {'aspiration': 30000},
+                'pvs+aspiration': {'pvs': True, 'aspiration': 30000},
+                'history': {'ordering': Othello.MoveOrdering},
+                'history+mobility': {'ordering': functools.partial(Othello.MoveOrdering, mobility_depth=3)},
+                'history+pvs': {'ordering': Othello.MoveOrdering, 'pvs': True}}
+
+def parse_spec(text):
+    """Turn 'Iago:3' into ('Iago', 3) and 'random_strategy' into itself."""
+    name, *args = text.split(':')
+    if not args:
+        return name
+    return (name,) + tuple(int(arg) if arg.lstrip('-').isdigit() else arg for arg in args)
+
+def spec_name(spec):
+    """A readable name for a spec, like 'Iago(3)'."""
+    if isinstance(spec, str):
+        return spec
+    name, *args = spec
+    return '{0}({1})'.format(name, ', '.join(map(str, args)))
+
+def accepts_option(fn, name):
+    """Can fn be called with the keyword argument name?"""
+    params = inspect.signature(fn).parameters.values()
+    return any(p.name == name or p.kind == p.VAR_KEYWORD for p in params)
+
+def make_strategy(spec, stats_hook=None):
+    """
+    Build the strategy for spec. The stats_hook is passed on to factories
+    that accept one.
+    """
+    if isinstance(spec, str):
+        return getattr(Othello, spec)
+    name, *args = spec
+    factory = getattr(Othello, name)
+    args = [getattr(Othello, arg) if isinstance(arg, str) and hasattr(Othello, arg) else arg for arg in args]
+    if stats_hook is not None and accepts_option(factory, 'stats_hook'):
+        return factory(*args, stats_hook=stats_hook)
+    return factory(*args)
+
+def close_strategy(strategy):
+    """Shut down what a strategy holds, like alphabeta_parallel's pool, if it can."""
+    close = getattr(strategy, 'close', None)
+    if close is not None:
+        close()
+
+def percentile(values, q):
+    """The q-th percentile (0-100) of values, by nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def timed_strategy(spec, latencies, records):
+    """Build the strategy for spec, timing each of its moves."""
+    strategy = make_strategy(spec, records.append)
+    def timed(player, board):
+        start = time.perf_counter()
+        move = strategy(player, board)
+        latencies.append(time.perf_counter() - start)
+        return move
+    timed.close = functools.partial(close_strategy, strategy)
+    return timed
+
+def play_game(black_spec, white_spec, opening):
+    """
+    Play one game, possibly in a worker process. Returns a dict with black's
+    score, and the move latencies, search nodes and search time of each player.
+    """
+    latencies = {BLACK: [], WHITE: []}
+    records = {BLACK: [], WHITE: []}
+    black = timed_strategy(black_spec, latencies[BLACK], records[BLACK])
+    white = timed_strategy(white_spec, latencies[WHITE], records[WHITE])
+    try:
+        _, score = play(black, white, opening)
+    finally:
+        close_strategy(black)
+        close_strategy(white)
+    return {'score': score,
+            'latencies': latencies,
+            'nodes': {who: sum(r['nodes'] for r in records[who]) for who in (BLACK, WHITE)},
+            'search_seconds': {who: sum(r['seconds'] for r in records[who]) for who in (BLACK, WHITE)}}
+
+def map_games(tasks, processes):
+    """Play the (black, white, opening) tasks, in a process pool unless processes is 1."""
+    if processes == 1:
+        return [play_game(*task) for task in tasks]
+    table = Othello.edge_table_file or list(Othello.edge_table)
+    with ProcessPoolExecutor(processes, initializer=init_search_worker, initargs=(table, None)) as pool:
+        return list(pool.map(play_game, *zip(*tasks)))
+
+def run_match(spec_a, spec_b, games=10, opening_moves=4, processes=None, seed=0):
+    """
+    Play games between two strategies and report the results from the first
+    one's point of view. Each random opening is played twice with the colors
+    swapped. Returns a dict with the win/draw/loss counts, the score with a
+    95% confidence interval, games per second, and the latency percentiles
+    and nodes per second of each strategy.
+    """
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(games):
+        if i % 2 == 0:
+            opening = random_opening(opening_moves, rng)
+            tasks.append((spec_a, spec_b, opening))
+        else:
+            tasks.append((spec_b, spec_a, opening))
+    start = time.perf_counter()
+    results = map_games(tasks, processes)
+    seconds = time.perf_counter() - start
+
+    outcomes = []
+    sides = {side: {'latencies': [], 'nodes': 0, 'search_seconds': 0} for side in ('a', 'b')}
+    for i, result in enumerate(results):
+        a_color, b_color = (BLACK, WHITE) if i % 2 == 0 else (WHITE, BLACK)
+        a_score = result['score'] if a_color == BLACK else -result['score']
+        outcomes.append(1.0 if a_score > 0 else 0.5 if a_score == 0 else 0.0)
+        for side, color in (('a', a_color), ('b', b_color)):
+            sides[side]['latencies'].extend(result['latencies'][color])
+            sides[side]['nodes'] += result['nodes'][color]
+            sides[side]['search_seconds'] += result['search_seconds'][color]
+
+    n = len(outcomes)
+    mean = sum(outcomes) / n
+    deviation = math.sqrt(sum((x - mean) ** 2 for x in outcomes) / (n - 1)) if n > 1 else 0.0
+    margin = 1.96 * deviation / math.sqrt(n)
+    report = {'a': spec_name(spec_a), 'b': spec_name(spec_b), 'games': n,
+              'wins': outcomes.count(1.0), 'draws': outcomes.count(0.5), 'losses': outcomes.count(0.0),
+              'score': mean, 'score_interval': (max(0.0, mean - margin), min(1.0, mean + margin)),
+              'seconds': seconds, 'games_per_second': n / seconds}
+    for side in ('a', 'b'):
+        latencies = sides[side]['latencies']
+        searching = sides[side]['search_seconds']
+        report[side + '_latency'] = {'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90),
+                                     'p99': percentile(latencies, 99), 'max': max(latencies, default=None)}
+        # The endgame solver's nodes on its last few empties aren't counted.
+        report[side + '_nodes_per_second'] = sides[side]['nodes'] / searching if searching else None
+    return report
+
+def run_positions(spec, positions=BENCHMARK_POSITIONS):
+    """
+    Search each benchmark position with a fresh strategy built from spec.
+    Returns a list with the move, nodes and seconds for each position.
+    """
+    results = []
+    for text, player in positions:
+        board = parse_position(text)
+        records = []
+        strategy = make_strategy(spec, records.append)
+        start = time.perf_counter()
+        try:
+            move = strategy(player, board)
+        finally:
+            close_strategy(strategy)
+        results.append({'move': move, 'seconds': time.perf_counter() - start,
+                        'nodes': sum(r['nodes'] for r in records)})
+    return results
+
+def compare_modes(depth, modes=SEARCH_MODES, positions=BENCHMARK_POSITIONS):
+    """
+    Search each benchmark position to the same depth in each search mode.
+    Returns a dict from mode to its total nodes and seconds, the share of
+    cutoffs made by the first move searched, its moves, and the number of
+    moves that differ from those of the first mode.
+    """
+    results = {}
+    for mode, options in modes.items():
+        nodes, seconds, moves, cutoffs, first_move_cutoffs = 0, 0, [], 0, 0
+        for text, player in positions:
+            records = []
+            strategy = Othello.alphabeta_iterative(depth, Othello.Iago_eval, stats_hook=records.append, **options)
+            moves.append(strategy(player, parse_position(text)))
+            nodes += records[0]['nodes']
+            seconds += records[0]['seconds']
+            cutoffs += records[0]['beta_cutoffs']
+            first_move_cutoffs += records[0]['first_move_cutoffs']
+        results[mode] = {'nodes': nodes, 'seconds': seconds, 'moves': moves,
+                         'first_move_cutoff_rate': first_move_cutoffs / cutoffs if cutoffs else 0.0}
+    first = next(iter(results.values()))['moves']
+    for result in results.values():
+        result['changed_moves'] = sum(a != b for a, b in zip(first, result['moves']))
+    return results
+
+def format_report(report):
+    """Lay out a match report as text."""
+    lines = ['{a} vs {b}: +{wins} ={draws} -{losses} in {games} games'.format(**report),
+             'score {0:.3f} (95% CI {1:.3f}-{2:.3f}), {3:.2f} games/s'.format(
+                 report['score'], report['score_interval'][0], report['score_interval'][1],
+                 report['games_per_second'])]
+    for side in ('a', 'b'):
+        latency = report[side + '_latency']
+        nps = report[side + '_nodes_per_second']
+        lines.append('{0}: latency p50 {1:.4f}s p90 {2:.4f}s p99 {3:.4f}s max {4:.4f}s, {5} nodes/s'.format(
+            report[side], latency['p50'], latency['p90'], latency['p99'], latency['max'],
+            'n/a' if nps is None else int(nps)))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a match and time the benchmark positions.')
+    parser.add_argument('a', nargs='?', default='Iago:3', help='first strategy, e.g. Iago:3')
+    parser.add_argument('b', nargs='?', default='Iago:2', help='second strategy')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--opening-moves', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', type=int, metavar='DEPTH',
+                        help='only compare the node counts of the search modes at DEPTH')
+    args = parser.parse_args()
+
+    Othello.create_edge_table()
+    if args.modes:
+        for mode, result in compare_modes(args.modes).items():
+            print('{0}: {1} nodes in {2:.3f}s, first move cutoff rate {3:.3f}, {4} moves changed'.format(
+                mode, result['nodes'], result['seconds'], result['first_move_cutoff_rate'],
+                result['changed_moves']))
+        sys.exit()
+    spec_a, spec_b = parse_spec(args.a), parse_spec(args.b)
+    print(format_report(run_match(spec_a, spec_b, args.games, args.opening_moves, args.processes, args.seed)))
+    results = run_positions(spec_a)
+    print('{0} on {1} positions: {2} nodes in {3:.3f}s'.format(
+        spec_name(spec_a), len(results), sum(r['nodes'] for r in results), sum(r['seconds'] for r in results)))
@@ -0,0 +1,98 @@
+"""
+Bitboard move generation for Othello.
+
+Each side's discs are kept as a 64-bit integer. Bit 8*row + col (with row
+and col counted from 0) stands for the square 10*(row+1) + (col+1) of the
+100-element board used in Othello.py, so bit 0 is square 11 and bit 63 is
+square 88.
+"""
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+# Masks that clear the column a shifted disc would wrap around into.
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F
+
+# The eight directions as (shift, mask) pairs. Positive shifts move towards
+# square 88, negative shifts towards square 11.
+SHIFTS = ((-8, FULL),        # up
+          (-7, NOT_A_FILE),  # up right
+          (1, NOT_A_FILE),   # right
+          (9, NOT_A_FILE),   # down right
+          (8, FULL),         # down
+          (7, NOT_H_FILE),   # down left
+          (-1, NOT_H_FILE),  # left
+          (-9, NOT_H_FILE))  # up left
+
+# The initial position
+INITIAL_BLACK = (1 << 28) | (1 << 35)
+INITIAL_WHITE = (1 << 27) | (1 << 36)
+
+def shift(bits, n, mask):
+    """Shift every disc in bits one step in the direction given by n."""
+    if n > 0:
+        return (bits << n) & mask & FULL
+    return (bits >> -n) & mask
+
+def popcount(bits):
+    """Count the discs in bits."""
+    return bin(bits).count('1')
+
+def iter_bits(bits):
+    """Yield the index of every set bit, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def neighbors_mask(bits):
+    """All squares adjacent to some disc in bits."""
+    result = 0
+    for n, mask in SHIFTS:
+        result |= shift(bits, n, mask)
+    return result
+
+def legal_moves_mask(mine, theirs):
+    """Mask of the empty squares where the owner of mine can move."""
+    empty = ~(mine | theirs) & FULL
+    moves = 0
+    for n, mask in SHIFTS:
+        # Walk along runs of opponent discs starting next to our discs;
+        # an empty square at the end of a run is a legal move.
+        x = shift(mine, n, mask) & theirs
+        x |= shift(x, n, mask) & theirs
+        x |= shift(x, n, mask) & theirs
+        x |= shift(x, n, mask) & theirs
+        x |= shift(x, n, mask) & theirs
+        x |= shift(x, n, mask) & theirs
+        moves |= shift(x, n, mask) & empty
+    return moves
+
+def flip_mask(move, mine, theirs):
+    """Mask of the discs flipped when the owner of mine plays the bit move."""
+    flipped = 0
+    for n, mask in SHIFTS:
+        line = 0
+        x = shift(move, n, mask)
+        while x & theirs:
+            line |= x
+            x = shift(x, n, mask)
+        if x & mine:
+            flipped |= line
+    return flipped
+
+def play_move(move, mine, theirs):
+    """Return the (mine, theirs) pair after playing the bit move."""
+    flipped = flip_mask(move, mine, theirs)
+    return mine | move | flipped, theirs & ~flipped
+
+def mobility(mine, theirs):
+    """
+    Return the current and potential mobility of the owner of mine, counted
+    the same way as mobility in Othello.py: (legal moves, legal moves plus
+    empty squares next to an opponent disc that are not legal moves).
+    """
+    empty = ~(mine | theirs) & FULL
+    current = legal_moves_mask(mine, theirs)
+    potential = neighbors_mask(theirs) & empty
+    return popcount(current), popcount(current | potential)
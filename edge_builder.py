@@ -0,0 +1,243 @@
+"""
+Fast construction of the edge table.
+
+build_edge_table computes the same values as Othello.init_edge_table, but
+works on the base-3 edge indices directly instead of on full boards. An edge
+position is a list of 10 digits in the order of Othello.top_edge (0 for an
+empty square, 1 for black and 2 for white). Everything that doesn't depend on
+the table itself (static values, move probabilities and the index reached
+after each move) is computed once up front, optionally in one process per
+piece count. The five improvement passes then only look up and combine table
+values, vectorized with NumPy when it is available.
+
+Run as a script to write edge_table.txt and edge_table.bin.
+"""
+
+import sys
+from itertools import combinations, product
+from multiprocessing import Pool
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from Othello import (BLACK, combine_edge_moves, save_data, save_edge_table,
+                     static_edge_table)
+
+N_SQUARES = 10
+N_INDICES = 3 ** N_SQUARES
+
+# Positions 0 and 9 are the X-squares, 1 and 8 the corners, and 1 to 8 the
+# squares of the edge row itself.
+X_SQUARES = (0, 9)
+CORNERS = (1, 8)
+CORNER_FOR = {0: 1, 9: 8}
+X_SQUARE_FOR = {1: 0, 8: 9}
+ROW = range(1, 9)
+
+# The number of improvement passes made by init_edge_table
+N_PASSES = 5
+
+# Probability of an edge move from the number of neighbors owned by the
+# player and by the opponent (see Othello.edge_move_probability)
+NEIGHBOR_PROBABILITY = [[.1, .4, .7],
+                        [.05, .3, None],
+                        [.01, None, None]]
+
+def decode(index):
+    """The list of digits of an edge index, most significant first."""
+    digits = [0] * N_SQUARES
+    for i in range(N_SQUARES - 1, -1, -1):
+        index, digits[i] = divmod(index, 3)
+    return digits
+
+def encode(digits):
+    """The edge index of a list of digits."""
+    index = 0
+    for d in digits:
+        index = index * 3 + d
+    return index
+
+def other(piece):
+    """The opponent's digit."""
+    return 3 - piece
+
+def brackets(digits, pos, piece, step):
+    """
+    The positions that piece would flip from pos in the direction step along
+    the edge row, or an empty list if there is no bracket.
+    """
+    opp = other(piece)
+    run = []
+    sq = pos + step
+    while sq in ROW and digits[sq] == opp:
+        run.append(sq)
+        sq += step
+    if run and sq in ROW and digits[sq] == piece:
+        return run
+    return []
+
+def is_legal(digits, pos, piece):
+    """Is a move to pos legal for piece? Only moves along the row can flip."""
+    return (pos in ROW and digits[pos] == 0 and
+            bool(brackets(digits, pos, piece, 1) or brackets(digits, pos, piece, -1)))
+
+def make_move(digits, pos, piece):
+    """Return the digits after piece moves to pos."""
+    result = digits[:]
+    result[pos] = piece
+    if pos in ROW:
+        for sq in brackets(digits, pos, piece, 1) + brackets(digits, pos, piece, -1):
+            result[sq] = piece
+    return result
+
+def piece_stability(digits, pos):
+    """0 for stable, 1 for semi-stable and 2 for unstable, as in Othello.py."""
+    stable, semi_stable, unstable = 0, 1, 2
+    if pos in CORNERS:
+        return stable
+    elif pos in X_SQUARES:
+        return unstable if digits[CORNER_FOR[pos]] == 0 else semi_stable
+    piece = digits[pos]
+    opp = other(piece)
+    # The first square that isn't piece's on each side; None is off the edge
+    p1 = next((digits[sq] for sq in range(pos, 9) if digits[sq] != piece), None)
+    p2 = next((digits[sq] for sq in range(pos - 1, 0, -1) if digits[sq] != piece), None)
+    if (p1 == 0 and p2 == opp) or (p2 == 0 and p1 == opp):
+        return unstable
+    elif p1 == opp and p2 == opp and any(digits[sq] == 0 for sq in ROW):
+        return semi_stable
+    elif p1 == 0 and p2 == 0:
+        return semi_stable
+    return stable
+
+def static_value(digits):
+    """The static stability of the edge for black."""
+    score = 0
+    for pos, piece in enumerate(digits):
+        if piece == 1:
+            score += static_edge_table[pos][piece_stability(digits, pos)]
+        elif piece == 2:
+            score -= static_edge_table[pos][piece_stability(digits, pos)]
+    return score
+
+def move_probability(digits, pos):
+    """The probability that black can move to pos."""
+    if pos in X_SQUARES:
+        return 0.5
+    elif is_legal(digits, pos, 1):
+        return 1.0
+    elif pos in CORNERS:
+        x_square = digits[X_SQUARE_FOR[pos]]
+        if x_square == 0:
+            return 0.1
+        elif x_square == 1:
+            return 0.001
+        return 0.9
+    mine = sum(1 for sq in (pos - 1, pos + 1) if digits[sq] == 1)
+    theirs = sum(1 for sq in (pos - 1, pos + 1) if digits[sq] == 2)
+    if is_legal(digits, pos, 2):
+        return NEIGHBOR_PROBABILITY[mine][theirs] / 2
+    return NEIGHBOR_PROBABILITY[mine][theirs]
+
+def swapped(digits):
+    """The same edge seen from the other side."""
+    return [other(d) if d else 0 for d in digits]
+
+def edges_with_n_pieces(n):
+    """All the edge indices with exactly n pieces, in increasing order."""
+    indices = []
+    for positions in combinations(range(N_SQUARES), n):
+        for pieces in product((1, 2), repeat=n):
+            digits = [0] * N_SQUARES
+            for pos, piece in zip(positions, pieces):
+                digits[pos] = piece
+            indices.append(encode(digits))
+    return sorted(indices)
+
+def piece_count_data(n):
+    """
+    Everything about the edges with n pieces that doesn't depend on the
+    table: their indices, static values and, for each edge, the
+    (probability, index) pairs of black's possible moves, where the index
+    is that of the resulting edge seen from white's side.
+    """
+    indices = edges_with_n_pieces(n)
+    statics, moves = [], []
+    for index in indices:
+        digits = decode(index)
+        statics.append(static_value(digits))
+        moves.append([(move_probability(digits, pos), encode(swapped(make_move(digits, pos, 1))))
+                      for pos in range(N_SQUARES) if digits[pos] == 0])
+    return indices, statics, moves
+
+def improve(table, indices, moves):
+    """One improvement step for the edges with the same number of pieces."""
+    return [combine_edge_moves([(1.0, table[index])] + [(prob, -table[after]) for prob, after in options], BLACK)
+            for index, options in zip(indices, moves)]
+
+def improve_numpy(table, indices, probs, afters):
+    """
+    The same step as improve for all the edges at once. The arrays hold one
+    row per edge, with the edge itself in the first column, so the floating
+    point operations are the same as in combine_edge_moves.
+    """
+    values = table[afters]
+    values[:, 1:] *= -1
+    # A stable sort on the negated values keeps equal values in their original
+    # order, like sorted(..., reverse=True).
+    order = np.argsort(-values, axis=1, kind='stable')
+    values = np.take_along_axis(values, order, axis=1)
+    probs = np.take_along_axis(probs, order, axis=1)
+    prob = np.ones(len(indices))
+    val = np.zeros(len(indices))
+    # prob never drops below zero, so unlike combine_edge_moves
+    # there is no need to stop early.
+    for col in range(values.shape[1]):
+        val += prob * probs[:, col] * values[:, col]
+        prob -= prob * probs[:, col]
+    return np.rint(val).astype(np.int64)
+
+def build_edge_table(processes=None, use_numpy=True):
+    """
+    Build the edge table, returning it as a list of ints. The precomputation
+    for each piece count runs in a pool of `processes` processes if given.
+    """
+    if processes:
+        with Pool(processes) as pool:
+            data = pool.map(piece_count_data, range(N_SQUARES + 1))
+    else:
+        data = [piece_count_data(n) for n in range(N_SQUARES + 1)]
+
+    table = [0] * N_INDICES
+    for indices, statics, _ in data:
+        for index, value in zip(indices, statics):
+            table[index] = value
+
+    if use_numpy and np is not None:
+        table = np.array(table, dtype=np.int64)
+        arrays = {}
+        for n in range(1, N_SQUARES):
+            indices, _, moves = data[n]
+            probs = np.array([[1.0] + [prob for prob, _ in options] for options in moves])
+            afters = np.array([[index] + [after for _, after in options]
+                               for index, options in zip(indices, moves)])
+            arrays[n] = np.array(indices), probs, afters
+        for _ in range(N_PASSES):
+            for n in range(N_SQUARES - 1, 0, -1):
+                indices, probs, afters = arrays[n]
+                table[indices] = improve_numpy(table, indices, probs, afters)
+        return table.tolist()
+
+    for _ in range(N_PASSES):
+        for n in range(N_SQUARES - 1, 0, -1):
+            indices, _, moves = data[n]
+            for index, value in zip(indices, improve(table, indices, moves)):
+                table[index] = value
+    return table
+
+if __name__ == '__main__':
+    table = build_edge_table(processes=N_SQUARES + 1)
+    save_data(sys.argv[1] if len(sys.argv) > 1 else 'edge_table.txt', table)
+    save_edge_table(sys.argv[2] if len(sys.argv) > 2 else 'edge_table.bin', table)
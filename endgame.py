@@ -0,0 +1,147 @@
+"""
+Exact endgame search on bitboards.
+
+The solver plays a position out to the end of the game. In exact mode it
+returns the final disc margin for the side to move (its discs minus the
+opponent's, like score in Othello.py); in win/loss/draw mode it only finds
+the sign of that margin, which needs a much smaller tree.
+"""
+
+from bitboard import FULL, flip_mask, iter_bits, legal_moves_mask, popcount
+
+# With this many empty squares or fewer, moves are found by trying each empty
+# square in turn, which is cheaper than building the legal move mask.
+LAST_FEW_EMPTIES = 5
+
+# With more empty squares than this, moves are ordered fastest-first: the move
+# that leaves the opponent the fewest replies is searched first.
+FASTEST_FIRST_EMPTIES = 7
+
+# Margins lie in -64..64, so these work as infinities.
+WORST, BEST = -65, 65
+
+# The four 4x4 quadrants of the board
+QUADRANTS = tuple(sum(1 << (8*row + col) for row in rows for col in cols)
+                  for rows in (range(0, 4), range(4, 8))
+                  for cols in (range(0, 4), range(4, 8)))
+
+def final_margin(mine, theirs):
+    """The value of a finished game to the owner of mine."""
+    return popcount(mine) - popcount(theirs)
+
+def parity_order(moves, empty):
+    """
+    List the moves as single bits, those in quadrants with an odd number
+    of empty squares first. Playing there tends to get the last move in
+    each region.
+    """
+    odd, even = 0, 0
+    for quadrant in QUADRANTS:
+        if popcount(empty & quadrant) & 1:
+            odd |= moves & quadrant
+        else:
+            even |= moves & quadrant
+    return [1 << i for i in iter_bits(odd)] + [1 << i for i in iter_bits(even)]
+
+def fastest_first_order(mine, theirs, moves, empty):
+    """List the moves ordered by the opponent's mobility after each one."""
+    keyed = []
+    for rank, move in enumerate(parity_order(moves, empty)):
+        flipped = flip_mask(move, mine, theirs)
+        replies = popcount(legal_moves_mask(theirs & ~flipped, mine | move | flipped))
+        keyed.append((replies, rank, move))
+    keyed.sort()
+    return [move for _, _, move in keyed]
+
+def order_moves(mine, theirs, moves, empty, n_empty):
+    """Order the moves for searching, depending on how many empties are left."""
+    if n_empty > FASTEST_FIRST_EMPTIES:
+        return fastest_first_order(mine, theirs, moves, empty)
+    return parity_order(moves, empty)
+
+def search(mine, theirs, alpha, beta, passed=False, limits=None):
+    """
+    Negamax alpha-beta search to the end of the game. Returns the final
+    margin for the owner of mine when it lies strictly inside (alpha, beta),
+    and a bound on it otherwise. `passed` is true when the opponent has just
+    passed. limits, if given, is ticked at every node (see solve).
+    """
+    if limits is not None:
+        limits.tick()
+    empty = ~(mine | theirs) & FULL
+    n_empty = popcount(empty)
+    if n_empty <= LAST_FEW_EMPTIES:
+        return search_last(mine, theirs, alpha, beta, empty, passed)
+    moves = legal_moves_mask(mine, theirs)
+    if not moves:
+        if passed:
+            return final_margin(mine, theirs)
+        return -search(theirs, mine, -beta, -alpha, True, limits)
+    best = WORST
+    for move in order_moves(mine, theirs, moves, empty, n_empty):
+        flipped = flip_mask(move, mine, theirs)
+        val = -search(theirs & ~flipped, mine | move | flipped, -beta, -alpha, False, limits)
+        if val > best:
+            best = val
+            if val > alpha:
+                alpha = val
+                if alpha >= beta:
+                    break
+    return best
+
+def search_last(mine, theirs, alpha, beta, empty, passed=False):
+    """
+    The same search for the last few empty squares. Each empty square is
+    tried directly and the empty mask is carried down instead of recomputed.
+    """
+    if not empty:
+        return final_margin(mine, theirs)
+    best = WORST
+    for move in parity_order(empty, empty):
+        flipped = flip_mask(move, mine, theirs)
+        if not flipped:
+            continue
+        val = -search_last(theirs & ~flipped, mine | move | flipped,
+                           -beta, -alpha, empty ^ move)
+        if val > best:
+            best = val
+            if val > alpha:
+                alpha = val
+                if alpha >= beta:
+                    break
+    if best == WORST:
+        # No empty square is a legal move, so this player has to pass.
+        if passed:
+            return final_margin(mine, theirs)
+        return -search_last(theirs, mine, -beta, -alpha, empty, True)
+    return best
+
+def solve(mine, theirs, exact=True, limits=None):
+    """
+    Solve the position for the owner of mine, who is to move.
+    Returns (value, move) where move is the bit of the best move, or None if
+    there is no legal move. The value is the final disc margin in exact mode,
+    and -1, 0 or 1 for a loss, draw or win otherwise.
+    If limits is given (an Othello.SearchLimits), its tick method is called
+    at every node above the last few empties, and the solve is abandoned by
+    the SearchTimeout it raises once the budget runs out or it is cancelled.
+    """
+    alpha, beta = (WORST, BEST) if exact else (-1, 1)
+    moves = legal_moves_mask(mine, theirs)
+    if not moves:
+        val = -search(theirs, mine, -beta, -alpha, True, limits)
+        return (val if exact else (val > 0) - (val < 0)), None
+    empty = ~(mine | theirs) & FULL
+    best_val, best_move = WORST, None
+    for move in order_moves(mine, theirs, moves, empty, popcount(empty)):
+        flipped = flip_mask(move, mine, theirs)
+        val = -search(theirs & ~flipped, mine | move | flipped, -beta, -alpha, False, limits)
+        if val > best_val:
+            best_val, best_move = val, move
+            if val > alpha:
+                alpha = val
+                if alpha >= beta:
+                    break
+    if not exact:
+        best_val = (best_val > 0) - (best_val < 0)
+    return best_val, best_move
@@ -0,0 +1,78 @@
+"""
+A cache of evaluations shared by searches.
+
+Leaf positions repeat across the searches of one game and across games, and
+positions that are rotations or reflections of each other have the same
+value. EvalCache keeps the most recently used values under the canonical
+position (see symmetry.py) and the move number, which Iago_eval's
+coefficients depend on. One cache can serve any number of strategies and
+games in a process, as long as they use the same evaluation function,
+including games played in different threads: every operation takes the
+cache's lock. It is not shared between processes; each worker of a process
+pool has a cache of its own.
+"""
+
+import threading
+from collections import OrderedDict
+
+from Othello import move_number_of
+from symmetry import canonical_position
+
+class EvalCache:
+    """
+    A bounded LRU cache of evaluations with hit, miss and eviction counts,
+    safe to share between threads.
+    """
+    def __init__(self, maxsize=2**18):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the value stored for key, or None."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Store the value for key, evicting the least recently used entry if full."""
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries, keeping the counters."""
+        with self.lock:
+            self.entries.clear()
+
+    def counters(self):
+        """The counters as a dict, with the hit rate."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else None}
+
+def cached_eval(evaluate, cache):
+    """Return an evaluation function that looks up evaluate's values in cache."""
+    def cached(player, board, context=None):
+        number = context.move_number if context is not None else move_number_of(board)
+        key = (canonical_position(player, board)[0], number)
+        value = cache.get(key)
+        if value is None:
+            value = evaluate(player, board, context)
+            cache.put(key, value)
+        return value
+    return cached
@@ -0,0 +1,131 @@
+"""
+Compact game records.
+
+A game file starts with a header (magic and format version) followed by the
+games one after the other. Each game is a 2-byte header, the number of moves
+and black's final disc margin, and then one byte per move: the bit index of
+the square (0 to 63, numbered as in bitboard.py) or PASS. A 60-move game
+takes about 62 bytes.
+
+Games are lists of squares with None for a pass, together with black's
+margin. Files are written and read one game at a time, so they can be
+appended to and scanned without holding them in memory.
+"""
+
+import os
+import random
+import struct
+
+from Othello import (BIT_INDEX, BLACK, INDEX_SQUARES, any_legal_move,
+                     initial_board, make_move, opponent, play, random_opening)
+
+GAMES_MAGIC = b'OGAM'
+GAMES_VERSION = 1
+GAMES_HEADER = struct.Struct('<4sHxx')
+GAME_HEADER = struct.Struct('<Bb')
+
+# The move byte for a pass
+PASS = 64
+
+def encode_game(moves, black_score):
+    """The bytes of one game."""
+    return GAME_HEADER.pack(len(moves), black_score) + bytes(PASS if move is None else BIT_INDEX[move]
+                                                              for move in moves)
+
+def write_games(filename, games):
+    """
+    Append the (moves, black_score) games, which may come from a generator,
+    to the file, creating it if needed. Returns the number of games written.
+    """
+    if os.path.exists(filename) and os.path.getsize(filename):
+        check_header(filename)
+        mode = 'ab'
+    else:
+        mode = 'wb'
+    count = 0
+    with open(filename, mode) as f:
+        if mode == 'wb':
+            f.write(GAMES_HEADER.pack(GAMES_MAGIC, GAMES_VERSION))
+        for moves, black_score in games:
+            f.write(encode_game(moves, black_score))
+            count += 1
+    return count
+
+def check_header(filename):
+    """Raise ValueError unless filename starts with a game file header."""
+    with open(filename, 'rb') as f:
+        read_header(f, filename)
+
+def read_header(f, filename):
+    """Read and check the file header from f."""
+    header = f.read(GAMES_HEADER.size)
+    if len(header) < GAMES_HEADER.size:
+        raise ValueError('{0} is not a game file'.format(filename))
+    magic, version = GAMES_HEADER.unpack(header)
+    if magic != GAMES_MAGIC or version != GAMES_VERSION:
+        raise ValueError('{0} is not a version {1} game file'.format(filename, GAMES_VERSION))
+
+def read_games(filename):
+    """Yield the (moves, black_score) games in the file one at a time."""
+    with open(filename, 'rb') as f:
+        read_header(f, filename)
+        while True:
+            header = f.read(GAME_HEADER.size)
+            if not header:
+                return
+            if len(header) < GAME_HEADER.size:
+                raise ValueError('{0} ends in the middle of a game'.format(filename))
+            n_moves, black_score = GAME_HEADER.unpack(header)
+            data = f.read(n_moves)
+            if len(data) < n_moves:
+                raise ValueError('{0} ends in the middle of a game'.format(filename))
+            yield [None if b == PASS else INDEX_SQUARES[b] for b in data], black_score
+
+def replay(moves):
+    """
+    Yield (player, board, move) for every move of a game, with the board as
+    it is before the move. The same board is updated in place as the game
+    goes on, so copy it to keep a position.
+    """
+    board = initial_board()
+    player = BLACK
+    for move in moves:
+        yield player, board, move
+        if move is not None:
+            make_move(move, player, board)
+        player = opponent(player)
+
+def with_passes(moves):
+    """Insert a None for every pass into a list of moves without passes."""
+    board = initial_board()
+    player = BLACK
+    result = []
+    for move in moves:
+        if not any_legal_move(player, board):
+            result.append(None)
+            player = opponent(player)
+        result.append(move)
+        make_move(move, player, board)
+        player = opponent(player)
+    return result
+
+def play_recorded(black_strategy, white_strategy, opening=()):
+    """Play a game like play, returning its (moves, black_score) record."""
+    played = []
+    def recorded(strategy):
+        def record(player, board):
+            move = strategy(player, board)
+            played.append(move)
+            return move
+        return record
+    _, black_score = play(recorded(black_strategy), recorded(white_strategy), opening)
+    return with_passes(list(opening) + played), black_score
+
+def self_play_games(black_strategy, white_strategy, n_games, opening_moves=4, seed=0):
+    """
+    Yield n_games game records, each starting with opening_moves random
+    moves before the strategies take over.
+    """
+    rng = random.Random(seed)
+    for _ in range(n_games):
+        yield play_recorded(black_strategy, white_strategy, random_opening(opening_moves, rng))
@@ -0,0 +1,185 @@
+"""
+Opening book.
+
+The book maps positions to a move and its score. Positions are normalized
+over the 8 symmetries of the board (see symmetry.py), so one entry
+covers every equivalent position, and are seen from the side to move, so the
+key does not depend on color.
+
+On disk the book is a header followed by fixed-size records sorted by key:
+a 64-bit position hash, the score, the move (a bit index in the normalized
+orientation) and the search depth (0 for moves taken from game records).
+The file is memory-mapped and searched by bisection, so opening a book costs
+nothing and all processes that use it share its pages.
+"""
+
+import hashlib
+import mmap
+import random
+import struct
+import sys
+
+from Othello import (BIT_INDEX, BLACK, INDEX_SQUARES, MAX_VALUE, MIN_VALUE,
+                     Iago_eval, SearchContext, TranspositionTable, alphabeta,
+                     create_edge_table, initial_board, legal_moves, make_move,
+                     move_number_of, next_player)
+from symmetry import INVERSES, SYMMETRIES, canonical_position
+
+BOOK_MAGIC = b'OBOK'
+BOOK_VERSION = 1
+BOOK_HEADER = struct.Struct('<4sHxxI')
+BOOK_RECORD = struct.Struct('<QiBBxx')
+
+# Scores are stored as 32-bit ints, so infinite values are clipped.
+SCORE_LIMIT = 2**31 - 1
+
+def normalize(player, board):
+    """
+    Return (key, sym), where key is the hash of the normalized position with
+    player to move, and sym is the index of the symmetry that normalizes it.
+    """
+    (mine, theirs), sym = canonical_position(player, board)
+    digest = hashlib.blake2b(mine.to_bytes(8, 'little') + theirs.to_bytes(8, 'little'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little'), sym
+
+def clip(score):
+    """Fit a score into the range of the file format."""
+    return int(max(-SCORE_LIMIT, min(SCORE_LIMIT, score)))
+
+class BookBuilder:
+    """
+    Collects book moves before they are written out. Searched moves are kept
+    per position with the deepest search winning. Moves from game records
+    are only used for positions that were never searched, choosing the move
+    with the best average result for the player who made it.
+    """
+    def __init__(self):
+        self.searched = {}
+        self.played = {}
+
+    def add_search(self, player, board, move, score, depth):
+        """Record the result of a search of the position."""
+        key, sym = normalize(player, board)
+        if key not in self.searched or self.searched[key][2] <= depth:
+            self.searched[key] = (SYMMETRIES[sym][BIT_INDEX[move]], clip(score), depth)
+
+    def add_game(self, moves, black_score, plies=20):
+        """
+        Record the first plies moves of a game that ended with black_score
+        (black's disc margin). Passes may be given as None, as in
+        game_records.
+        """
+        board = initial_board()
+        player = BLACK
+        for move in moves[:plies]:
+            if player is None:
+                break
+            if move is None:
+                # Passes are implied by next_player.
+                continue
+            key, sym = normalize(player, board)
+            result = black_score if player == BLACK else -black_score
+            stats = self.played.setdefault(key, {}).setdefault(SYMMETRIES[sym][BIT_INDEX[move]], [0, 0])
+            stats[0] += 1
+            stats[1] += result
+            make_move(move, player, board)
+            player = next_player(board, player)
+
+    def entries(self):
+        """The (key, score, move, depth) entries of the book, sorted by key."""
+        entries = {key: (score, move, depth) for key, (move, score, depth) in self.searched.items()}
+        for key, moves in self.played.items():
+            if key not in entries:
+                move, (count, total) = max(moves.items(), key=lambda item: (item[1][1] / item[1][0], item[1][0]))
+                entries[key] = (clip(round(total / count)), move, 0)
+        return sorted((key,) + value for key, value in entries.items())
+
+    def save(self, filename):
+        """Write the book to filename."""
+        entries = self.entries()
+        with open(filename, 'wb') as f:
+            f.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, len(entries)))
+            for entry in entries:
+                f.write(BOOK_RECORD.pack(*entry))
+
+def build_from_self_play(evaluate, depth=4, games=100, plies=16, random_plies=6, seed=0):
+    """
+    Build a book by self-play. Each game starts with up to random_plies
+    random moves for variety; every position up to plies is then searched to
+    depth and the best move is recorded and played.
+    """
+    builder = BookBuilder()
+    rng = random.Random(seed)
+    for _ in range(games):
+        board = initial_board()
+        player = BLACK
+        n_random = rng.randint(0, random_plies)
+        for ply in range(plies):
+            if player is None:
+                break
+            if ply < n_random:
+                move = rng.choice(legal_moves(player, board))
+            else:
+                context = SearchContext(evaluate, move_number_of(board), TranspositionTable())
+                killer = None
+                for d in range(1, depth + 1):
+                    score, killer = alphabeta(player, board, MIN_VALUE, MAX_VALUE, d, context, killer)
+                move = killer
+                builder.add_search(player, board, move, score, depth)
+            make_move(move, player, board)
+            player = next_player(board, player)
+    return builder
+
+class OpeningBook:
+    """A book file mapped into memory."""
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = BOOK_HEADER.unpack_from(self.data)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError('{0} is not a version {1} opening book'.format(filename, BOOK_VERSION))
+        if len(self.data) != BOOK_HEADER.size + self.size * BOOK_RECORD.size:
+            raise ValueError('{0} is truncated'.format(filename))
+
+    def __len__(self):
+        return self.size
+
+    def record(self, i):
+        """The (key, score, move, depth) record at position i."""
+        return BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + i * BOOK_RECORD.size)
+
+    def lookup(self, player, board):
+        """
+        Return (move, score, depth) for player in this position,
+        or None if the position isn't in the book.
+        """
+        key, sym = normalize(player, board)
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.size:
+            return None
+        found, score, move, depth = self.record(lo)
+        if found != key:
+            return None
+        return INDEX_SQUARES[INVERSES[sym][move]], score, depth
+
+def book_strategy(book, strategy):
+    """
+    Return a strategy that plays the book move when the position is in the
+    book and falls back to strategy otherwise.
+    """
+    def with_book(player, board):
+        entry = book.lookup(player, board)
+        if entry is not None and entry[0] in legal_moves(player, board):
+            return entry[0]
+        return strategy(player, board)
+    return with_book
+
+if __name__ == '__main__':
+    create_edge_table()
+    build_from_self_play(Iago_eval).save(sys.argv[1] if len(sys.argv) > 1 else 'opening_book.bin')
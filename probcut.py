@@ -0,0 +1,175 @@
+"""
+ProbCut: selective search by prediction from shallow searches.
+
+The value of a deep search is close to a linear function of the value of a
+shallower one, v_deep = a * v_shallow + b, with an error whose standard
+deviation sigma can be measured. At a node searched to depth, alphabeta
+(see Othello.probcut) runs a null-window search SHALLOW_REDUCTION plies
+shallower and cuts the node when the prediction lies more than threshold
+sigmas outside the window. Because the reduction is even, both searches end
+on the same side to move, so Iago's odd/even swing doesn't spoil the fit.
+Parameters exist for several depths, so cuts also happen inside the shallow
+searches, as in multi-ProbCut.
+
+The parameters are fitted per depth and game stage (STAGE_MOVES moves each)
+by calibrate, from positions of self-play games, and kept in a JSON file.
+Run as a script to calibrate or to compare node counts and moves with the
+full-width search, e.g.
+
+    python probcut.py calibrate --positions 200 --depth 6
+    python probcut.py compare 6 --threshold 1.5
+"""
+
+import argparse
+import json
+import math
+import random
+
+from Othello import (BLACK, MAX_VALUE, MIN_VALUE, Iago, Iago_eval,
+                     SearchContext, TranspositionTable, alphabeta,
+                     create_edge_table, initial_board, legal_moves, make_move,
+                     move_number_of, next_player)
+from benchmark import compare_modes
+
+PROBCUT_FILE = 'probcut.json'
+
+# The shallow search is this many plies shallower than the deep one
+SHALLOW_REDUCTION = 2
+
+# A game stage is this many moves
+STAGE_MOVES = 10
+
+# A depth and stage needs at least this many positions to be fitted
+MIN_SAMPLES = 10
+
+# Cut when the prediction is this many standard deviations outside the window
+THRESHOLD = 1.5
+
+class ProbCut:
+    """
+    The fitted parameters, a dict from (depth, stage) to
+    (shallow depth, a, b, sigma), and the cut threshold in sigmas.
+    """
+    def __init__(self, params, threshold=THRESHOLD, stage_moves=STAGE_MOVES):
+        self.params = params
+        self.threshold = threshold
+        self.stage_moves = stage_moves
+
+    def lookup(self, depth, move_number):
+        """The parameters for a search to depth at move_number, or None."""
+        return self.params.get((depth, move_number // self.stage_moves))
+
+    def save(self, filename=PROBCUT_FILE):
+        """Write the parameters to a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump({'threshold': self.threshold, 'stage_moves': self.stage_moves,
+                       'params': [[depth, stage] + list(values)
+                                  for (depth, stage), values in sorted(self.params.items())]}, f, indent=1)
+
+    @classmethod
+    def load(cls, filename=PROBCUT_FILE, threshold=None):
+        """Read parameters written by save, optionally with another threshold."""
+        with open(filename) as f:
+            data = json.load(f)
+        params = {(depth, stage): tuple(values) for depth, stage, *values in data['params']}
+        return cls(params, data['threshold'] if threshold is None else threshold, data['stage_moves'])
+
+def sample_positions(n_positions, opening_moves=8, every=3, seed=0):
+    """
+    Positions from games of Iago(1) against itself after random openings,
+    taking every few plies while more than 12 squares are empty.
+    """
+    rng = random.Random(seed)
+    strategy = Iago(1, endgame_empties=0)
+    positions = []
+    while len(positions) < n_positions:
+        board = initial_board()
+        player = BLACK
+        ply = 0
+        while player is not None and board.count('.') > 12 and len(positions) < n_positions:
+            if ply < opening_moves:
+                move = rng.choice(legal_moves(player, board))
+            else:
+                move = strategy(player, board)
+                if ply % every == 0:
+                    positions.append((player, board[:]))
+            make_move(move, player, board)
+            player = next_player(board, player)
+            ply += 1
+    return positions
+
+def search_values(player, board, max_depth, evaluate=Iago_eval):
+    """The values of full-width searches of the position to depths 1 to max_depth."""
+    context = SearchContext(evaluate, move_number_of(board), TranspositionTable())
+    values = []
+    killer = None
+    for depth in range(1, max_depth + 1):
+        val, killer = alphabeta(player, board, MIN_VALUE, MAX_VALUE, depth, context, killer)
+        values.append(val)
+    return values
+
+def fit(pairs):
+    """Least squares fit of y = a * x + b. Returns (a, b, sigma)."""
+    n = len(pairs)
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    var = sum((x - mean_x) ** 2 for x, _ in pairs)
+    a = sum((x - mean_x) * (y - mean_y) for x, y in pairs) / var if var else 1.0
+    b = mean_y - a * mean_x
+    sigma = math.sqrt(sum((y - a * x - b) ** 2 for x, y in pairs) / max(n - 2, 1))
+    return a, b, sigma
+
+def calibrate(n_positions=200, max_depth=6, seed=0, stage_moves=STAGE_MOVES):
+    """
+    Fit the parameters for depths SHALLOW_REDUCTION + 1 to max_depth on
+    sampled positions. Returns a ProbCut.
+    """
+    samples = {}
+    for player, board in sample_positions(n_positions, seed=seed):
+        stage = move_number_of(board) // stage_moves
+        values = search_values(player, board, max_depth)
+        for depth in range(SHALLOW_REDUCTION + 1, max_depth + 1):
+            shallow, deep = values[depth - SHALLOW_REDUCTION - 1], values[depth - 1]
+            # Won or lost positions have infinite values and tell nothing.
+            if MIN_VALUE < shallow < MAX_VALUE and MIN_VALUE < deep < MAX_VALUE:
+                samples.setdefault((depth, stage), []).append((shallow, deep))
+    params = {}
+    for (depth, stage), pairs in samples.items():
+        if len(pairs) >= MIN_SAMPLES:
+            a, b, sigma = fit(pairs)
+            if a > 0:
+                params[(depth, stage)] = (depth - SHALLOW_REDUCTION, a, b, sigma)
+    return ProbCut(params, stage_moves=stage_moves)
+
+def compare(depth, probcut):
+    """
+    Compare the full-width and ProbCut searches to depth on the benchmark
+    positions, as in benchmark.compare_modes.
+    """
+    return compare_modes(depth, {'full width': {}, 'probcut': {'probcut': probcut}})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate and compare ProbCut.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = commands.add_parser('calibrate', help='fit the parameters')
+    calibrate_parser.add_argument('--positions', type=int, default=200)
+    calibrate_parser.add_argument('--depth', type=int, default=6, help='deepest depth to fit')
+    calibrate_parser.add_argument('--seed', type=int, default=0)
+    calibrate_parser.add_argument('--out', default=PROBCUT_FILE)
+    compare_parser = commands.add_parser('compare', help='compare with the full-width search')
+    compare_parser.add_argument('depth', type=int)
+    compare_parser.add_argument('--file', default=PROBCUT_FILE)
+    compare_parser.add_argument('--threshold', type=float)
+    args = parser.parse_args()
+
+    create_edge_table()
+    if args.command == 'calibrate':
+        probcut = calibrate(args.positions, args.depth, args.seed)
+        probcut.save(args.out)
+        for (depth, stage), (shallow, a, b, sigma) in sorted(probcut.params.items()):
+            print('depth {0} from {1}, moves {2}-{3}: a {4:.3f} b {5:.0f} sigma {6:.0f}'.format(
+                depth, shallow, stage * probcut.stage_moves, (stage + 1) * probcut.stage_moves - 1, a, b, sigma))
+    else:
+        for mode, result in compare(args.depth, ProbCut.load(args.file, args.threshold)).items():
+            print('{0}: {1} nodes in {2:.3f}s, {3} moves changed'.format(
+                mode, result['nodes'], result['seconds'], result['changed_moves']))
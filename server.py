@@ -0,0 +1,254 @@
+"""
+A game server for the engine.
+
+Clients connect over TCP or a Unix socket and send one JSON object per line.
+Every request may carry an "id", which is copied into its response; responses
+to requests sent without waiting can come back in any order. The requests are
+
+    {"op": "new"}
+        Start a game. Returns {"game", "board", "player"}.
+    {"op": "search", "board": ..., "player": "@"}
+    {"op": "search", "game": ...}
+        Find Iago's move for a position or for the player to move in a game,
+        without playing it. Takes an optional "depth" (1 to MAX_DEPTH, default
+        DEPTH) and "time_limit" (positive, in milliseconds). Returns {"move"}.
+    {"op": "play", "game": ..., "move": 34}
+        Play a move in a game. Returns {"board", "player", "score"}, where
+        player is null once the game is over and the game has been dropped.
+
+Boards are the 64 squares row by row, as Othello.parse_position reads them.
+Errors come back as {"error": message}.
+
+A game belongs to the connection that started it and is dropped when the
+game ends or the connection closes. A connection can have at most MAX_GAMES
+games going at once.
+
+Searches run in a process pool that loads the edge table once per worker.
+A search waits for one of the workers' slots, so work beyond what the pool
+can do queues up in the server, and a connection with MAX_PENDING requests
+outstanding isn't read from until one of them is answered. When a client
+disconnects, its searches are cancelled through a flag per slot that the
+workers check as they search.
+
+Run as a script to serve, e.g.
+
+    python server.py --port 7654
+    python server.py --unix /tmp/othello.sock
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import Othello
+from Othello import (BLACK, WHITE, Iago, IllegalMoveError, create_edge_table,
+                     format_position, init_search_worker, initial_board,
+                     legal_moves, make_move, next_player, parse_position,
+                     score)
+
+DEPTH = 4
+MAX_DEPTH = 8
+
+# With a time limit, the endgame solver takes over at this many empty
+# squares instead of Iago's default, so a solve stays within a few tens of
+# milliseconds
+TIMED_ENDGAME_EMPTIES = 8
+
+# The most requests a connection can have outstanding before the server
+# stops reading from it
+MAX_PENDING = 16
+
+# The most unfinished games a connection can have
+MAX_GAMES = 64
+
+# In a worker process, one cancel flag for each slot of the pool
+cancel_flags = None
+
+def init_server_worker(table, flags):
+    """Set up a worker process with the edge table and the cancel flags."""
+    global cancel_flags
+    init_search_worker(table, None)
+    cancel_flags = flags
+
+def search_position(slot, board, player, depth, time_limit):
+    """Search a position in a worker process, stopping if slot is cancelled."""
+    options = {'endgame_empties': TIMED_ENDGAME_EMPTIES} if time_limit is not None else {}
+    strategy = Iago(depth, time_limit=time_limit, cancelled=lambda: cancel_flags[slot], **options)
+    return strategy(player, board)
+
+class GameServer:
+    """The games, the worker pool and its slots."""
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.cancel_flags = multiprocessing.Array('b', self.workers)
+        table = Othello.edge_table_file or list(Othello.edge_table)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_server_worker,
+                                        initargs=(table, self.cancel_flags))
+        self.slots = asyncio.Queue()
+        for slot in range(self.workers):
+            self.slots.put_nowait(slot)
+        self.games = {}
+        self.game_ids = itertools.count(1)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def search(self, board, player, depth, time_limit):
+        """Run a search in the pool once a slot is free."""
+        slot = await self.slots.get()
+        try:
+            self.cancel_flags[slot] = 0
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.pool, search_position, slot, board, player, depth, time_limit)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The worker has to stop before its slot can be used again.
+                self.cancel_flags[slot] = 1
+                await asyncio.wait([future])
+                raise
+        finally:
+            self.slots.put_nowait(slot)
+
+    def game(self, request):
+        """The game named in request."""
+        try:
+            return self.games[request['game']]
+        except KeyError:
+            raise ValueError('unknown game {0!r}'.format(request.get('game')))
+
+    async def handle(self, request, owned):
+        """Answer one request from a connection that owns the games in the set owned."""
+        op = request.get('op')
+        if op == 'new':
+            if len(owned) >= MAX_GAMES:
+                raise ValueError('at most {0} games at once'.format(MAX_GAMES))
+            game_id = next(self.game_ids)
+            self.games[game_id] = {'board': initial_board(), 'player': BLACK}
+            owned.add(game_id)
+            return {'game': game_id, 'board': format_position(self.games[game_id]['board']), 'player': BLACK}
+        elif op == 'search':
+            if 'game' in request:
+                game = self.game(request)
+                board, player = game['board'][:], game['player']
+            else:
+                if len(request['board']) != 64:
+                    raise ValueError('a board has 64 squares')
+                board, player = parse_position(request['board']), request['player']
+            if player not in (BLACK, WHITE):
+                raise ValueError('no player to move')
+            if not legal_moves(player, board):
+                raise ValueError('{0} has no legal moves'.format(player))
+            depth = min(int(request.get('depth', DEPTH)), MAX_DEPTH)
+            if depth < 1:
+                raise ValueError('depth must be at least 1')
+            time_limit = request.get('time_limit')
+            if time_limit is not None:
+                time_limit = float(time_limit)
+                if not math.isfinite(time_limit) or time_limit <= 0:
+                    raise ValueError('time_limit must be a positive number of milliseconds')
+            return {'move': await self.search(board, player, depth, time_limit)}
+        elif op == 'play':
+            game = self.game(request)
+            if game['player'] is None:
+                raise ValueError('the game is over')
+            move = request['move']
+            if move not in legal_moves(game['player'], game['board']):
+                raise IllegalMoveError(game['player'], move, game['board'])
+            make_move(move, game['player'], game['board'])
+            game['player'] = next_player(game['board'], game['player'])
+            if game['player'] is None:
+                self.end_game(request['game'], owned)
+            return {'board': format_position(game['board']), 'player': game['player'],
+                    'score': score(BLACK, game['board'])}
+        raise ValueError('unknown op {0!r}'.format(op))
+
+    def end_game(self, game_id, owned):
+        """Forget a game."""
+        self.games.pop(game_id, None)
+        owned.discard(game_id)
+
+    async def respond(self, line, writer, lock, pending, owned):
+        """Answer the request on line and write the response."""
+        request = {}
+        try:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    request = {}
+                    raise ValueError('a request is a JSON object')
+                response = await self.handle(request, owned)
+            except (ValueError, KeyError, TypeError, IllegalMoveError) as e:
+                response = {'error': str(e) if not isinstance(e, KeyError) else 'missing {0}'.format(e)}
+            if 'id' in request:
+                response['id'] = request['id']
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            pending.release()
+
+    async def serve_client(self, reader, writer):
+        """Read requests from one client until it disconnects."""
+        lock = asyncio.Lock()
+        pending = asyncio.Semaphore(MAX_PENDING)
+        tasks = set()
+        owned = set()
+        try:
+            while True:
+                await pending.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    # ValueError is a line longer than the stream's limit.
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    pending.release()
+                    continue
+                task = asyncio.create_task(self.respond(line, writer, lock, pending, owned))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for game_id in list(owned):
+                self.end_game(game_id, owned)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+async def serve(host='127.0.0.1', port=7654, path=None, workers=None):
+    """Serve on a TCP port, or on the Unix socket at path, until cancelled."""
+    game_server = GameServer(workers)
+    if path is not None:
+        server = await asyncio.start_unix_server(game_server.serve_client, path)
+    else:
+        server = await asyncio.start_server(game_server.serve_client, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the engine over a socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7654)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    create_edge_table()
+    asyncio.run(serve(args.host, args.port, args.unix, args.workers))
@@ -0,0 +1,89 @@
+"""
+The 8 symmetries of the board and canonical positions.
+
+Rotating or reflecting a position gives an equivalent one: the same moves,
+mirrored, and the same value. A position is made canonical by taking the
+smallest of its 8 images as a (mine, theirs) pair of bitboards, seen from the
+side to move. Each symmetry is a composition of a transpose, a vertical flip
+and a horizontal mirror, done with bit tricks on the whole bitboard.
+
+SYMMETRIES lists each symmetry as a mapping of bit indices and
+SQUARE_SYMMETRIES as a mapping of the squares of the 100-element board,
+in the same order as images() returns the images.
+"""
+
+from Othello import INDEX_SQUARES, to_bitboards
+
+# The functions below work on two bitboards at once, packed into one int as
+# first << 64 | second. The masks are repeated for both halves, and no shift
+# carries a bit across from one half to the other. A single bitboard works
+# as well.
+LOW = 0xFFFFFFFFFFFFFFFF
+
+def repeat(mask):
+    """A 64-bit mask for both halves of a pair."""
+    return mask << 64 | mask
+
+K1, K2, K4 = repeat(0x5555555555555555), repeat(0x3333333333333333), repeat(0x0F0F0F0F0F0F0F0F)
+T1, T2, T4 = repeat(0x5500550055005500), repeat(0x3333000033330000), repeat(0x0F0F0F0F00000000)
+
+def flip_vertical(bits):
+    """Swap the rows of the bitboards top to bottom."""
+    # Reversing all 16 bytes also swaps the two halves, so swap them back.
+    bits = int.from_bytes(bits.to_bytes(16, 'little'), 'big')
+    return (bits >> 64) | (bits & LOW) << 64
+
+def mirror_horizontal(bits):
+    """Swap the columns of the bitboards left to right."""
+    bits = ((bits >> 1) & K1) | ((bits & K1) << 1)
+    bits = ((bits >> 2) & K2) | ((bits & K2) << 2)
+    return ((bits >> 4) & K4) | ((bits & K4) << 4)
+
+def transpose(bits):
+    """Swap the rows and columns of the bitboards."""
+    t = T4 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = T2 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = T1 & (bits ^ (bits << 7))
+    return bits ^ t ^ (t >> 7)
+
+def images(bits):
+    """The 8 images of the bitboards, the identity first."""
+    result = []
+    for t in (bits, transpose(bits)):
+        for v in (t, flip_vertical(t)):
+            result.append(v)
+            result.append(mirror_horizontal(v))
+    return result
+
+# Each symmetry as the bit index each bit index goes to
+SYMMETRIES = tuple(zip(*(tuple(image.bit_length() - 1 for image in images(1 << i)) for i in range(64))))
+
+# The inverse of each symmetry
+INVERSES = tuple(tuple(sym.index(i) for i in range(64)) for sym in SYMMETRIES)
+
+# Each symmetry as the square each square of the 100-element board goes to.
+# Squares off the board stay where they are.
+SQUARE_SYMMETRIES = tuple([sq if sq not in INDEX_SQUARES else INDEX_SQUARES[sym[INDEX_SQUARES.index(sq)]]
+                           for sq in range(100)] for sym in SYMMETRIES)
+
+def canonical(mine, theirs):
+    """
+    Return ((mine, theirs), sym): the smallest image of the position and the
+    index of the symmetry that gives it.
+    """
+    pairs = images(mine << 64 | theirs)
+    best = min(pairs)
+    return (best >> 64, best & LOW), pairs.index(best)
+
+def canonical_position(player, board):
+    """canonical for player on the 100-element board."""
+    return canonical(*to_bitboards(player, board))
+
+def transform_board(board, sym):
+    """The image of a 100-element board under a symmetry."""
+    result = board[:]
+    for sq, image in enumerate(SQUARE_SYMMETRIES[sym]):
+        result[image] = board[sq]
+    return result